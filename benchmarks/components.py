@@ -0,0 +1,228 @@
+"""Time the scoring components on synthetic DITA tasks of growing size.
+
+For each document size (in steps) and damage level, a reference and a
+damaged hypothesis are generated with benchmarks/synthetic_dita.py and
+each component is timed on them:
+
+* tokenizer: XMLTokenizer on the hypothesis
+* expat_tokenizer: ExpatTokenizer on the hypothesis
+* expat_streaming: ExpatTokenizer.iter_tokens over the hypothesis file
+* ter: metric_engines.ter on the token lists
+* pyter: pyter.ter on the token lists, up to --pyter-max-tokens (it is
+  quadratic in memory)
+* diff: the unified diff that xater_metric writes (metric_engines.diff)
+* dtd_validation: validation_error_metric, with its DTD cache warm
+
+Times are the best of --repeat runs after a warm-up run. A component
+whose warm-up took longer than --max-seconds is only timed once, without
+measuring memory, and is not run on the larger sizes. Peak memory is measured in a separate
+run with tracemalloc, so it only counts Python allocations, not libxml2's.
+Results are written as JSON; pass an earlier result file as --baseline to
+flag components that got slower than --threshold times the baseline:
+
+    python benchmarks/components.py --output before.json
+    python benchmarks/components.py --baseline before.json
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import pyter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from markup_metrics.profile_logger import ProfileLogger  # noqa: E402
+from markup_metrics.tokenize_xml import ExpatTokenizer, XMLTokenizer  # noqa: E402
+from markup_metrics.utils import setup_catalog_env_var  # noqa: E402
+from metric_engines.diff import unified_diff  # noqa: E402
+from metric_engines.ter import ter  # noqa: E402
+from metric_engines.types import MetricInput  # noqa: E402
+from metric_engines.validation_error_metric import (  # noqa: E402
+    MetricEngine as ValidationErrorMetric,
+)
+from synthetic_dita import damaged_xml, generate_task, task_xml  # noqa: E402
+
+
+def components(
+    reference_xml: str, hypothesis_xml: str, output_dir: Path, pyter_max_tokens: int
+) -> Dict[str, Callable[[], Any]]:
+    tokenizer = XMLTokenizer()
+    expat_tokenizer = ExpatTokenizer()
+    reference_tokens = tokenizer.tokenize(reference_xml)
+    hypothesis_tokens = tokenizer.tokenize(hypothesis_xml)
+    metric_input = MetricInput(
+        Path("synthetic.txt"),
+        "",
+        hypothesis_xml,
+        reference_xml,
+        hypothesis_tokens,
+        reference_tokens,
+        profile_logger=ProfileLogger(),
+    )
+    validation_metric = ValidationErrorMetric()
+    hypothesis_file = output_dir / "hypothesis.xml"
+    hypothesis_file.write_text(hypothesis_xml)
+
+    def stream_tokens():
+        with hypothesis_file.open("r") as stream:
+            for _ in expat_tokenizer.iter_tokens(stream):
+                pass
+
+    timed = {
+        "tokenizer": lambda: tokenizer.tokenize(hypothesis_xml),
+        "expat_tokenizer": lambda: expat_tokenizer.tokenize(hypothesis_xml),
+        "expat_streaming": stream_tokens,
+        "ter": lambda: ter(hypothesis_tokens, reference_tokens),
+        "pyter": lambda: pyter.ter(hypothesis_tokens, reference_tokens),
+        "diff": lambda: list(unified_diff(reference_tokens, hypothesis_tokens)),
+        "dtd_validation": lambda: validation_metric.calculate(metric_input, output_dir),
+    }
+    if max(len(reference_tokens), len(hypothesis_tokens)) > pyter_max_tokens:
+        del timed["pyter"]
+    return timed
+
+
+def measure(
+    function: Callable[[], Any], repeat: int, max_seconds: float
+) -> Dict[str, Any]:
+    # the first run warms up caches, and is the only one if it is too slow
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    if seconds > max_seconds:
+        return {"seconds": seconds, "peak_kib": None}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_kib": peak / 1024}
+
+
+def run(args) -> List[Dict[str, Any]]:
+    results = []
+    too_slow = set()
+    with tempfile.TemporaryDirectory() as output_dir:
+        for steps in args.sizes:
+            task = generate_task(steps, args.seed)
+            reference_xml = task_xml(task, "synthetic")
+            for damage in args.damage:
+                hypothesis_xml = damaged_xml(task, "synthetic", damage, args.seed)
+                tokens = len(XMLTokenizer().tokenize(hypothesis_xml))
+                timed = components(
+                    reference_xml,
+                    hypothesis_xml,
+                    Path(output_dir),
+                    args.pyter_max_tokens,
+                )
+                for component, function in timed.items():
+                    if args.components and component not in args.components:
+                        continue
+                    if component in too_slow:
+                        continue
+                    measured = measure(function, args.repeat, args.max_seconds)
+                    if measured["peak_kib"] is None:
+                        too_slow.add(component)
+                    result = {
+                        "component": component,
+                        "steps": steps,
+                        "damage": damage,
+                        "bytes": len(hypothesis_xml.encode("utf-8")),
+                        "tokens": tokens,
+                        **measured,
+                        "tokens_per_second": tokens / max(measured["seconds"], 1e-9),
+                    }
+                    results.append(result)
+                    print(
+                        f"{component:15} steps {steps:6} damage {damage:4.2f} "
+                        f"tokens {tokens:7} {measured['seconds']:10.6f}s "
+                        f"{result['tokens_per_second']:12.0f} tokens/s "
+                        + (
+                            f"{measured['peak_kib']:10.1f} KiB"
+                            if measured["peak_kib"] is not None
+                            else "    (too slow)"
+                        ),
+                        flush=True,
+                    )
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float
+) -> int:
+    def key(result):
+        return result["component"], result["steps"], result["damage"]
+
+    before = {key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        ratio = result["seconds"] / max(old["seconds"], 1e-9)
+        flag = ""
+        if ratio > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        component, steps, damage = key(result)
+        print(
+            f"{component:15} steps {steps:6} damage {damage:4.2f} "
+            f"{old['seconds']:10.6f}s -> {result['seconds']:10.6f}s "
+            f"({ratio:.2f}x){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 100, 300])
+    parser.add_argument("--damage", type=float, nargs="+", default=[0.0, 0.1, 0.3])
+    parser.add_argument(
+        "--components", nargs="+", help="Only benchmark these components."
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-seconds", type=float, default=5.0)
+    parser.add_argument("--pyter-max-tokens", type=int, default=200)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(__file__).parent / "results" / "components.json",
+    )
+    parser.add_argument("--baseline", type=Path, help="Earlier results to compare.")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    setup_catalog_env_var()
+    results = run(args)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(
+        json.dumps(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.threshold
+        )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
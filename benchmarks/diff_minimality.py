@@ -0,0 +1,108 @@
+"""Check that metric_engines.diff finds shortest edit scripts, and time it.
+
+Each diff must turn the first sequence into the second and keep as many
+tokens as their longest common subsequence. Random sequences come first,
+then synthetic DITA tasks of growing size against damaged copies, which
+are also diffed with difflib (with and without its junk heuristic, which
+keeps it fast on repetitive tokens by giving up on a minimal diff):
+
+    python benchmarks/diff_minimality.py --steps 100 1000
+"""
+import argparse
+import difflib
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.synthetic_dita import damaged_xml, generate_task  # noqa: E402
+from markup_metrics.tokenize_xml import XMLTokenizer  # noqa: E402
+from metric_engines.diff import opcodes  # noqa: E402
+
+
+def lcs_length(a, b) -> int:
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(
+                previous[j] + 1 if x == y else max(previous[j + 1], current[j])
+            )
+        previous = current
+    return previous[-1]
+
+
+def check(a, b) -> bool:
+    patched = []
+    kept = 0
+    for tag, i1, i2, j1, j2 in opcodes(a, b):
+        if tag == "equal":
+            if a[i1:i2] != b[j1:j2]:
+                return False
+            kept += i2 - i1
+        patched.extend(b[j1:j2])
+    return patched == list(b) and kept == lcs_length(a, b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--random-cases", type=int, default=3000)
+    parser.add_argument("--steps", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--damage", type=float, default=0.05)
+    parser.add_argument(
+        "--max-quadratic-steps",
+        type=int,
+        default=1000,
+        help="Largest task diffed with difflib without its junk heuristic.",
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    failures = 0
+    for _ in range(args.random_cases):
+        a = [rng.choice("abc") for _ in range(rng.randint(0, 25))]
+        b = [rng.choice("abcd") for _ in range(rng.randint(0, 25))]
+        if not check(a, b):
+            failures += 1
+            print(f"NOT MINIMAL {a!r} {b!r}")
+    print(f"random: {args.random_cases} pairs, {failures} failures")
+
+    tokenizer = XMLTokenizer()
+    for steps in args.steps:
+        task = generate_task(steps)
+        reference = tokenizer.tokenize(damaged_xml(task, "task", 0))
+        hypothesis = tokenizer.tokenize(damaged_xml(task, "task", args.damage))
+        diffs = [
+            ("myers", lambda: opcodes(reference, hypothesis)),
+            (
+                "difflib",
+                lambda: difflib.SequenceMatcher(
+                    None, reference, hypothesis
+                ).get_opcodes(),
+            ),
+        ]
+        if steps <= args.max_quadratic_steps:
+            diffs.append(
+                (
+                    "difflib without junk",
+                    lambda: difflib.SequenceMatcher(
+                        None, reference, hypothesis, autojunk=False
+                    ).get_opcodes(),
+                )
+            )
+        timings = []
+        for name, diff in diffs:
+            start = time.perf_counter()
+            codes = diff()
+            kept = sum(i2 - i1 for tag, i1, i2, _, _ in codes if tag == "equal")
+            timings.append(
+                f"{name} {time.perf_counter() - start:.3f}s, {kept} tokens kept"
+            )
+        print(f"{steps} steps, {len(reference)} tokens: " + "; ".join(timings))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
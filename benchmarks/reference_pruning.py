@@ -0,0 +1,139 @@
+"""Check that --prune-references keeps every best score, and time it.
+
+Writes a synthetic DITA corpus in which every input has several
+references, damaged to different degrees, and a damaged copy of the task
+as the hypothesis of a replaying markup engine. markup-metrics.py scores
+it with xater, with and without --prune-references; the scores in
+results.csv must be the same, and the metric calls and time of each run
+are printed:
+
+    python benchmarks/reference_pruning.py --inputs 8 --references 6 --steps 20
+"""
+import argparse
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.synthetic_dita import (  # noqa: E402
+    damaged_xml,
+    generate_task,
+    task_text,
+)
+
+ROOT = Path(__file__).parent.parent
+
+REPLAY_ENGINE = """import json
+from pathlib import Path
+
+HYPOTHESES = json.loads((Path(__file__).parent / "hypotheses.json").read_text())
+
+
+class AutoMarkup:
+    def automarkup(self, input_text: str, prompt: str, context=None) -> str:
+        return HYPOTHESES[input_text]
+"""
+
+
+def write_corpus(workdir: Path, inputs: int, references: int, steps: int) -> None:
+    schema_dir = workdir / "data" / "ditatask"
+    schema_dir.mkdir(parents=True)
+    (schema_dir / "prompt.txt").write_text(
+        (ROOT / "data" / "ditatask" / "prompt.txt").read_text()
+    )
+    hypotheses = {}
+    for i in range(inputs):
+        name = f"task{i}"
+        task = generate_task(steps, seed=i)
+        text = task_text(task, name)
+        (schema_dir / f"{name}.txt").write_text(text)
+        for j in range(references):
+            suffix = f".{j}" if j else ""
+            # references at different distances from the task, in no particular order
+            damage = 0.05 * ((j * 7 + i) % references)
+            (schema_dir / f"{name}{suffix}.xml").write_text(
+                damaged_xml(task, name, damage, seed=j)
+            )
+        hypotheses[text] = damaged_xml(task, name, 0.1, seed=1000 + i)
+    engines = workdir / "engines"
+    engines.mkdir()
+    (engines / "replay_automarkup.py").write_text(REPLAY_ENGINE)
+    (engines / "hypotheses.json").write_text(json.dumps(hypotheses))
+
+
+def run(workdir: Path, name: str, flags: List[str]) -> Tuple[Dict[str, str], str]:
+    outdir = workdir / name
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(ROOT / "markup-metrics.py"),
+            "--automarkup-engines",
+            str(workdir / "engines" / "replay_automarkup.py"),
+            "--metric-engines",
+            str(ROOT / "metric_engines" / "xater_metric.py"),
+            "--datadir",
+            str(workdir / "data"),
+            "--outdir",
+            str(outdir),
+            "--cache-dir",
+            str(workdir / "cache"),
+            "--no-automarkup-cache",
+            "--bootstrap-resamples",
+            "0",
+            "--artifacts",
+            "none",
+            "--report-format",
+            "none",
+            *flags,
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        print(result.stdout, result.stderr)
+        raise SystemExit(1)
+    with (outdir / "results.csv").open() as file:
+        scores = {row["input_file"]: row["score"] for row in csv.DictReader(file)}
+    with (outdir / "timing.tsv").open() as file:
+        metric = next(
+            row
+            for row in csv.DictReader(file, delimiter="\t")
+            if row["Context"] == "metric xater_metric"
+        )
+    return scores, f"{metric['Calls']} metric calls in {float(metric['Time (s)']):.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inputs", type=int, default=8)
+    parser.add_argument("--references", type=int, default=6)
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        write_corpus(workdir, args.inputs, args.references, args.steps)
+        all_scores, all_timing = run(workdir, "all", [])
+        pruned_scores, pruned_timing = run(workdir, "pruned", ["--prune-references"])
+    print(f"all references: {all_timing}")
+    print(f"pruned: {pruned_timing}")
+    mismatches = 0
+    for input_file, score in all_scores.items():
+        if pruned_scores.get(input_file) != score:
+            mismatches += 1
+            print(
+                f"MISMATCH {input_file}: {score} with all references, "
+                f"{pruned_scores.get(input_file)} pruned"
+            )
+    print(f"{len(all_scores)} inputs, {mismatches} mismatches")
+    return 1 if mismatches or not all_scores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Check that the automarkup scheduler keeps to its concurrency and rate limits.
+
+Runs fake engines through markup_metrics.scheduler.AutomarkupScheduler:
+
+* a slow engine, to check that no more than --max-in-flight calls run at
+  once and that the "automarkup" spans time the engine calls alone;
+* an instant engine on a fake clock, to check that calls start no faster
+  than --requests-per-minute and --tokens-per-minute allow, and that
+  a long run settles at those rates.
+
+    python benchmarks/scheduler_pacing.py --max-in-flight 3
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from markup_engines.types import Context  # noqa: E402
+from markup_metrics.profile_logger import ProfileLogger  # noqa: E402
+from markup_metrics.scheduler import AutomarkupScheduler  # noqa: E402
+
+
+class FakeClock:
+    """Time that only passes when a rate limiter sleeps."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+class SlowEngine:
+    name = "slow"
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def automarkup_async(self, input_text: str, prompt: str, context) -> str:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return input_text
+
+
+class InstantEngine:
+    """Records the (fake) time each call starts, and its token count."""
+
+    name = "instant"
+
+    def __init__(self, clock: FakeClock, tokens: int) -> None:
+        self.clock = clock
+        self.tokens = tokens
+        self.starts: List[float] = []
+
+    def count_tokens(self, input_text: str, prompt: str) -> int:
+        return self.tokens
+
+    async def automarkup_async(self, input_text: str, prompt: str, context) -> str:
+        self.starts.append(self.clock())
+        return input_text
+
+
+async def run(scheduler: AutomarkupScheduler, engine, calls: int) -> None:
+    await asyncio.gather(
+        *(
+            scheduler.automarkup(engine, f"input {i}", "", Context(None), f"call {i}")
+            for i in range(calls)
+        )
+    )
+
+
+def check_concurrency(max_in_flight: int, calls: int, delay: float) -> int:
+    engine = SlowEngine(delay)
+    prof_logger = ProfileLogger()
+
+    async def main():
+        await run(
+            AutomarkupScheduler(max_in_flight, prof_logger=prof_logger), engine, calls
+        )
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    spans = [log.time for log in prof_logger.times if log.stage == "automarkup"]
+    waits = [log.time for log in prof_logger.times if log.stage == "automarkup wait"]
+    print(
+        f"{calls} calls of {delay}s, at most {max_in_flight} in flight: "
+        f"{engine.max_in_flight} in flight, {elapsed:.2f}s; automarkup spans "
+        f"max {max(spans):.3f}s, total {sum(spans):.2f}s; "
+        f"waits total {sum(waits):.2f}s"
+    )
+    failures = 0
+    if engine.max_in_flight > max_in_flight:
+        print(f"FAIL: {engine.max_in_flight} calls in flight")
+        failures += 1
+    # generous margins for a loaded machine, well short of the queue wait
+    if max(spans) > delay * 1.5 + 0.05:
+        print(f"FAIL: an automarkup span of {max(spans):.3f}s includes queue wait")
+        failures += 1
+    return failures
+
+
+def check_pacing(
+    name: str, calls: int, tokens: int, requests_per_minute, tokens_per_minute
+) -> int:
+    clock = FakeClock()
+    engine = InstantEngine(clock, tokens)
+
+    async def main():
+        scheduler = AutomarkupScheduler(
+            4,
+            requests_per_minute,
+            tokens_per_minute,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        await run(scheduler, engine, calls)
+
+    asyncio.run(main())
+    # a call costs one request and `tokens` tokens of the per-minute budgets
+    limits = [
+        (per_minute, cost)
+        for per_minute, cost in ((requests_per_minute, 1), (tokens_per_minute, tokens))
+        if per_minute
+    ]
+    failures = 0
+    for started, at in enumerate(sorted(engine.starts), 1):
+        # a full bucket to start with, then refilled at the per-minute rate
+        allowed = min(
+            (per_minute + per_minute * at / 60) / cost for per_minute, cost in limits
+        )
+        if started > allowed + 1e-6:
+            if not failures:
+                print(
+                    f"FAIL: {started} calls started by {at:.1f}s, {allowed:.1f} allowed"
+                )
+            failures += 1
+    # calls per minute, and in the first burst
+    rate = min(per_minute / cost for per_minute, cost in limits)
+    expected = (calls - rate) / rate * 60
+    last = max(engine.starts)
+    print(
+        f"{name}: {calls} calls, the last starting at {last:.1f}s "
+        f"({expected:.1f}s expected)"
+    )
+    if abs(last - expected) > 60 / rate:
+        print(f"FAIL: {name} paced at the wrong rate")
+        failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-in-flight", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--requests-per-minute", type=float, default=30)
+    parser.add_argument("--tokens-per-minute", type=float, default=6000)
+    args = parser.parse_args()
+
+    failures = check_concurrency(args.max_in_flight, args.calls, args.delay)
+    calls = int(args.requests_per_minute * 3)
+    failures += check_pacing(
+        "requests per minute", calls, 10, args.requests_per_minute, None
+    )
+    failures += check_pacing(
+        "tokens per minute", calls, 500, None, args.tokens_per_minute
+    )
+    failures += check_pacing(
+        "both", calls, 500, args.requests_per_minute, args.tokens_per_minute
+    )
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
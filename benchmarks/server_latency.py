@@ -0,0 +1,172 @@
+"""Check that the scoring server gives the same scores to concurrent requests.
+
+Starts markup-metrics-server.py on a Unix socket and scores pairs of
+documents from data/ (each reference against another document of the same
+schema as its hypothesis) one request at a time, then again from several
+threads at once. The scores must be the same both times. The latency of a
+request is compared with a one-file run of markup-metrics.py, which has
+to start an interpreter and load the engines first:
+
+    python benchmarks/server_latency.py --concurrency 4
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).parent.parent
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def requests(datadir: Path, limit: int) -> List[Dict[str, Any]]:
+    bodies = []
+    for schema_dir in sorted(p for p in datadir.iterdir() if p.is_dir()):
+        references = sorted(
+            p
+            for p in schema_dir.glob("*.xml")
+            if p.with_suffix(".txt").exists() and p.name != "catalog.xml"
+        )
+        for reference, hypothesis in zip(references, references[1:] + references[:1]):
+            bodies.append(
+                {
+                    "text": reference.with_suffix(".txt").read_text(),
+                    "hypothesis": hypothesis.read_text(),
+                    "reference": reference.read_text(),
+                    "schema": schema_dir.name,
+                    "artifacts": "summary",
+                }
+            )
+    return bodies[:limit]
+
+
+def score(socket_path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    connection = UnixHTTPConnection(socket_path)
+    try:
+        connection.request(
+            "POST", "/score", json.dumps(body), {"Content-Type": "application/json"}
+        )
+        response = connection.getresponse()
+        result = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"{response.status}: {result['error']}")
+    return result
+
+
+def timed_score(socket_path: str, body: Dict[str, Any]):
+    start = time.perf_counter()
+    result = score(socket_path, body)
+    return time.perf_counter() - start, result
+
+
+def scores(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value["score"] for name, value in result["scores"].items()}
+
+
+def cli_run(workdir: Path) -> float:
+    filter_file = workdir / "filter.txt"
+    filter_file.write_text("test1.txt\n")
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            str(ROOT / "markup-metrics.py"),
+            "--automarkup-engines",
+            str(ROOT / "markup_engines" / "dummy_automarkup.py"),
+            "--filter-file",
+            str(filter_file),
+            "--no-automarkup-cache",
+            "--bootstrap-resamples",
+            "0",
+            "--replace",
+            "--outdir",
+            str(workdir / "cli"),
+        ],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--datadir", type=Path, default=ROOT / "data")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    bodies = requests(args.datadir, args.requests)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        socket_path = str(workdir / "server.sock")
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                str(ROOT / "markup-metrics-server.py"),
+                "--socket",
+                socket_path,
+                "--outdir",
+                str(workdir / "server"),
+            ],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            # the server prints one line when it is listening
+            server.stdout.readline()  # type: ignore
+            startup = time.perf_counter() - start
+            serial = [timed_score(socket_path, body) for body in bodies]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                concurrent = list(
+                    executor.map(lambda body: timed_score(socket_path, body), bodies)
+                )
+            concurrent_time = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        cli = cli_run(workdir)
+
+    mismatches = 0
+    for body, (_, expected), (_, actual) in zip(bodies, serial, concurrent):
+        if scores(expected) != scores(actual):
+            mismatches += 1
+            print(f"MISMATCH {body['schema']}: {scores(expected)} {scores(actual)}")
+    latencies = [latency for latency, _ in serial]
+    print(f"server startup {startup:.3f}s")
+    print(
+        f"{len(bodies)} requests one at a time: median {statistics.median(latencies):.4f}s"
+        f", max {max(latencies):.4f}s"
+    )
+    print(
+        f"{len(bodies)} requests from {args.concurrency} threads: {concurrent_time:.3f}s"
+        f", {mismatches} mismatches"
+    )
+    print(f"one-file markup-metrics.py run {cli:.3f}s")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Time the startup of markup-metrics.py, and of a small dummy-engine run.
+
+Engines are discovered lazily, so neither case should import guidance,
+tiktoken or openai. Each case is run --repeat times in a fresh
+interpreter, and the modules it imports are listed with
+`python -X importtime` to check that:
+
+    python benchmarks/startup.py --repeat 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).parent.parent
+SCRIPT = ROOT / "markup-metrics.py"
+# modules that only the engines talking to a language model import
+HEAVY_MODULES = ["guidance", "tiktoken", "openai"]
+
+
+def cases(workdir: Path) -> dict:
+    filter_file = workdir / "filter.txt"
+    filter_file.write_text("test1.txt\n")
+    return {
+        "help": ["--help"],
+        "dummy run": [
+            "--automarkup-engines",
+            str(ROOT / "markup_engines" / "dummy_automarkup.py"),
+            "--filter-file",
+            str(filter_file),
+            "--datadir",
+            str(ROOT / "data"),
+            "--no-automarkup-cache",
+            "--bootstrap-resamples",
+            "0",
+            "--replace",
+            "--outdir",
+            str(workdir / "out"),
+        ],
+    }
+
+
+def run(args: List[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    flags = ["-X", "importtime"] if importtime else []
+    return subprocess.run(
+        [sys.executable, *flags, str(SCRIPT), *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+
+def imported_modules(stderr: str) -> List[str]:
+    modules = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.append(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, case_args in cases(Path(workdir)).items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = run(case_args)
+                times.append(time.perf_counter() - start)
+                if result.returncode:
+                    print(result.stdout, result.stderr)
+                    return 1
+            modules = imported_modules(run(case_args, importtime=True).stderr)
+            heavy = sorted(
+                {
+                    module.split(".")[0]
+                    for module in modules
+                    if module.split(".")[0] in HEAVY_MODULES
+                }
+            )
+            print(
+                f"{name:10} min {min(times):.3f}s median {statistics.median(times):.3f}s"
+                f" {len(modules)} modules imported"
+                + (f", including {', '.join(heavy)}" if heavy else "")
+            )
+            failures += bool(heavy)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
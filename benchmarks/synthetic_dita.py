@@ -0,0 +1,161 @@
+"""Generate synthetic DITA task documents of any size, with damaged copies.
+
+The documents follow the shape of the tasks in data/ditatask: a title,
+short description, context and a list of steps. A damaged copy stands in
+for automarkup output: at damage level d, about a fraction d of the words
+are replaced, of the steps are moved, and of the elements lose or change
+their markup. The copies stay well-formed, so every metric can score them.
+
+Write a corpus laid out like data/ (inputs, references and prompt in
+`ditatask/`, damaged hypotheses with the reference's name in
+`hypotheses/`):
+
+    python benchmarks/synthetic_dita.py /tmp/corpus --sizes 10 100 --damage 0.1
+"""
+import argparse
+import random
+import shutil
+from pathlib import Path
+from typing import List, NamedTuple
+from xml.sax.saxutils import escape
+
+DOCTYPE = "<!DOCTYPE task PUBLIC '-//OASIS//DTD DITA Task//EN' 'task.dtd'>"
+
+WORDS = (
+    "the system device drive storage server database snow car paint disk "
+    "check configure restart remove install backup verify open close select "
+    "your before after each first then carefully all any new old vendor "
+    "software documentation settings partition format update service layer "
+    "of to with from for on in and or if so be it is are do not may must"
+).split()
+
+
+class Task(NamedTuple):
+    title: str
+    shortdesc: str
+    context: str
+    steps: List[str]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def generate_task(steps: int, seed: int = 0) -> Task:
+    rng = random.Random(seed)
+    return Task(
+        sentence(rng, 4)[:-1],
+        sentence(rng, 16),
+        " ".join(sentence(rng, 12) for _ in range(2)),
+        [
+            " ".join(
+                sentence(rng, rng.randint(6, 20)) for _ in range(rng.randint(1, 3))
+            )
+            for _ in range(steps)
+        ],
+    )
+
+
+def task_xml(task: Task, name: str) -> str:
+    steps = "".join(
+        f"      <step>\n        <cmd>{escape(step)}</cmd>\n      </step>\n"
+        for step in task.steps
+    )
+    return (
+        f'<?xml version="1.0" ?>{DOCTYPE}<task id="{name}" xml:lang="en-us">\n'
+        f"  <title>{escape(task.title)}</title>\n"
+        f"  <shortdesc>{escape(task.shortdesc)}</shortdesc>\n"
+        f"  <taskbody>\n"
+        f"    <context>{escape(task.context)}</context>\n"
+        f"    <steps>\n{steps}    </steps>\n"
+        f"  </taskbody>\n"
+        f"</task>"
+    )
+
+
+def task_text(task: Task, name: str) -> str:
+    steps = "\n\n".join(f"{i}.  {step}" for i, step in enumerate(task.steps, 1))
+    return (
+        f"# {task.title} {{#{name} .task}}\n\n{task.shortdesc}\n\n"
+        f"{task.context}\n\n{steps}\n"
+    )
+
+
+def damaged_xml(task: Task, name: str, damage: float, seed: int = 0) -> str:
+    """A well-formed copy of `task_xml(task, name)` damaged at level `damage`."""
+    rng = random.Random(seed)
+
+    def damage_words(text: str) -> str:
+        return " ".join(
+            rng.choice(WORDS) if rng.random() < damage else word
+            for word in text.split()
+        )
+
+    steps = [damage_words(step) for step in task.steps]
+    for _ in range(round(damage * len(steps))):
+        steps.insert(rng.randrange(len(steps)), steps.pop(rng.randrange(len(steps))))
+
+    step_xml = []
+    for step in steps:
+        roll = rng.random()
+        if roll < damage / 2:
+            # markup lost
+            step_xml.append(f"      {escape(step)}\n")
+        elif roll < damage:
+            # markup changed: valid elements in an invalid place
+            step_xml.append(
+                f"      <p>\n        <cmd>{escape(step)}</cmd>\n      </p>\n"
+            )
+        else:
+            step_xml.append(
+                f"      <step>\n        <cmd>{escape(step)}</cmd>\n      </step>\n"
+            )
+    context = damage_words(task.context)
+    context_xml = (
+        f"<p>{escape(context)}</p>" if rng.random() < damage else escape(context)
+    )
+    return (
+        f'<?xml version="1.0" ?>{DOCTYPE}<task id="{name}" xml:lang="en-us">\n'
+        f"  <title>{escape(damage_words(task.title))}</title>\n"
+        f"  <shortdesc>{escape(damage_words(task.shortdesc))}</shortdesc>\n"
+        f"  <taskbody>\n"
+        f"    <context>{context_xml}</context>\n"
+        f"    <steps>\n{''.join(step_xml)}    </steps>\n"
+        f"  </taskbody>\n"
+        f"</task>"
+    )
+
+
+def write_corpus(
+    outdir: Path, sizes: List[int], damages: List[float], seed: int = 0
+) -> None:
+    schema_dir = outdir / "ditatask"
+    hypotheses_dir = outdir / "hypotheses" / "ditatask"
+    schema_dir.mkdir(parents=True, exist_ok=True)
+    hypotheses_dir.mkdir(parents=True, exist_ok=True)
+    prompt = Path(__file__).parent.parent / "data" / "ditatask" / "prompt.txt"
+    shutil.copy(prompt, schema_dir / "prompt.txt")
+    for steps in sizes:
+        for damage in damages:
+            name = f"synthetic{steps}d{round(damage * 100)}"
+            task = generate_task(steps, seed)
+            (schema_dir / f"{name}.txt").write_text(task_text(task, name))
+            (schema_dir / f"{name}.xml").write_text(task_xml(task, name))
+            (hypotheses_dir / f"{name}.xml").write_text(
+                damaged_xml(task, name, damage, seed)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("outdir", type=Path)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--damage", type=float, nargs="+", default=[0.0, 0.1, 0.3])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_corpus(args.outdir, args.sizes, args.damage, args.seed)
+
+
+if __name__ == "__main__":
+    main()
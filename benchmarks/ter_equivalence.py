@@ -0,0 +1,102 @@
+"""Check that metric_engines.ter gives exactly pyter's scores, and time both.
+
+Compares random token sequences, then reference/reference and
+reference/hypothesis pairs from a corpus directory:
+
+    python benchmarks/ter_equivalence.py --datadir data/ditatask
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+from xml.sax import SAXParseException
+
+import pyter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from markup_metrics.tokenize_xml import XMLTokenizer  # noqa: E402
+from metric_engines.ter import ter  # noqa: E402
+
+
+def random_pairs(count: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        alphabet = "abcdef"[: rng.randint(1, 6)]
+        hypothesis = [rng.choice(alphabet) for _ in range(rng.randint(0, 12))]
+        reference = [rng.choice(alphabet) for _ in range(rng.randint(1, 12))]
+        yield "random", hypothesis, reference
+
+
+def corpus_pairs(datadir: Path, hypotheses_dir: "Path | None"):
+    tokenizer = XMLTokenizer()
+    references = sorted(p for p in datadir.rglob("*.xml") if p.name != "catalog.xml")
+    by_topic = {}
+    for path in references:
+        by_topic.setdefault(path.name.split(".")[0], []).append(path)
+
+    pairs = [
+        (hypothesis, reference)
+        for paths in by_topic.values()
+        for hypothesis, reference in itertools.islice(
+            itertools.permutations(paths, 2), 6
+        )
+    ]
+    if hypotheses_dir:
+        for hypothesis in sorted(hypotheses_dir.rglob("*.xml")):
+            reference = datadir / hypothesis.name
+            if reference.exists():
+                pairs.append((hypothesis, reference))
+
+    for hypothesis, reference in pairs:
+        try:
+            yield (
+                f"{hypothesis} / {reference.name}",
+                tokenizer.tokenize(hypothesis.read_text()),
+                tokenizer.tokenize(reference.read_text()),
+            )
+        except SAXParseException:
+            continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--datadir", type=Path, default=Path("data/ditatask"))
+    parser.add_argument(
+        "--hypotheses",
+        type=Path,
+        help="Directory of marked up outputs (e.g. out/<engine>) to compare too.",
+    )
+    parser.add_argument("--random-cases", type=int, default=3000)
+    args = parser.parse_args()
+
+    mismatches = 0
+    for label, pairs in (
+        ("random", random_pairs(args.random_cases, seed=1)),
+        (str(args.datadir), corpus_pairs(args.datadir, args.hypotheses)),
+    ):
+        pyter_time = ter_time = 0.0
+        count = 0
+        for name, hypothesis, reference in pairs:
+            start = time.perf_counter()
+            expected = pyter.ter(hypothesis, reference)
+            middle = time.perf_counter()
+            actual = ter(hypothesis, reference)
+            end = time.perf_counter()
+            pyter_time += middle - start
+            ter_time += end - middle
+            count += 1
+            if actual != expected:
+                mismatches += 1
+                print(f"MISMATCH {name}: pyter {expected!r}, ter {actual!r}")
+        print(
+            f"{label}: {count} pairs, pyter {pyter_time:.2f}s, "
+            f"ter {ter_time:.2f}s, speedup {pyter_time / max(ter_time, 1e-9):.1f}x"
+        )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Check that ExpatTokenizer gives exactly XMLTokenizer's tokens, and time both.
+
+Every file under the given directories is tokenized by both (files that
+do not parse must fail with the same error), followed by edge cases for
+entities, comments, CDATA, attributes and documents longer than one
+parser feed. The streaming `iter_tokens` of both tokenizers, from text
+streams, must give the same tokens too, and expat must give the same
+tokens for the document's UTF-8 bytes as XMLTokenizer does:
+
+    python benchmarks/tokenizer_parity.py data test_metrics
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+from xml.sax import SAXParseException
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from markup_metrics.tokenize_xml import ExpatTokenizer, XMLTokenizer  # noqa: E402
+
+EDGE_CASES = {
+    "entities": "<p>a&amp;b &lt;c&gt; &#233;&#x20AC; d</p>",
+    "undeclared entity with external DTD": (
+        '<!DOCTYPE p SYSTEM "p.dtd"><p>a&nbsp;b</p>'
+    ),
+    "comments and PIs": "<p>one<!-- two -->three<?pi x?>four</p>",
+    "CDATA": "<p>a<![CDATA[ <b> & ]]>c</p>",
+    "attributes": '<p z="1" id="x" a="&quot;q&quot;"><q id="y"/></p>',
+    "whitespace": "<p>\n  a \t b\r\n  <b> c </b>\n\n d  </p>",
+    "namespaces": '<x:p xmlns:x="urn:x" xmlns="urn:y"><q x:id="1"/></x:p>',
+    "internal subset": '<!DOCTYPE p [<!ENTITY e "ent">]><p>a &e; b</p>',
+    "long text": "<p>" + "word &amp; " * 20000 + "</p>",
+    "long document": "<p>" + "<q id='i'>some text\n</q>" * 5000 + "</p>",
+    "unclosed": "<p><q></p>",
+    "not xml": "just text",
+    "empty": "",
+}
+
+
+def tokenize(function, text):
+    try:
+        return list(function(text))
+    except SAXParseException as e:
+        return f"SAXParseException: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dirs", type=Path, nargs="*", default=[Path("data")])
+    args = parser.parse_args()
+
+    cases = dict(EDGE_CASES)
+    for directory in args.dirs:
+        for path in sorted(directory.rglob("*")):
+            if path.is_file():
+                try:
+                    cases[str(path)] = path.read_text(encoding="utf-8")
+                except UnicodeDecodeError:
+                    continue
+
+    reference, expat = XMLTokenizer(), ExpatTokenizer()
+    streaming = {
+        "xml stream": lambda text: reference.iter_tokens(io.StringIO(text)),
+        "expat stream": lambda text: expat.iter_tokens(io.StringIO(text)),
+        "expat bytes": lambda text: expat.tokenize(text.encode("utf-8")),
+    }
+    mismatches = 0
+    reference_time = expat_time = 0.0
+    for name, text in cases.items():
+        start = time.perf_counter()
+        expected = tokenize(reference.tokenize, text)
+        middle = time.perf_counter()
+        actual = tokenize(expat.tokenize, text)
+        end = time.perf_counter()
+        reference_time += middle - start
+        expat_time += end - middle
+        if actual != expected:
+            mismatches += 1
+            print(f"MISMATCH {name}")
+        expected_bytes = tokenize(reference.tokenize, text.encode("utf-8"))
+        for mode, function in streaming.items():
+            expected_mode = expected_bytes if mode == "expat bytes" else expected
+            if tokenize(function, text) != expected_mode:
+                mismatches += 1
+                print(f"MISMATCH {name} ({mode})")
+    print(
+        f"{len(cases)} documents, {mismatches} mismatches, "
+        f"xml {reference_time:.3f}s, expat {expat_time:.3f}s, "
+        f"speedup {reference_time / max(expat_time, 1e-9):.1f}x"
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+from markup_metrics.server import main
+
+main()
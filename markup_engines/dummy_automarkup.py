@@ -6,7 +6,7 @@ from xml.dom import minidom
 # markup engine (e.g., GPT-4).
 
 class AutoMarkup:
-    def automarkup(self, input_text: str, prompt: str) -> str:
+    def automarkup(self, input_text: str, prompt: str, context=None) -> str:
         lines = input_text.split("\n")
 
         doc = minidom.parseString("<!DOCTYPE task PUBLIC '-//OASIS//DTD DITA Task//EN' 'task.dtd'>\n<task></task>")
@@ -33,15 +33,29 @@ class AutoMarkup:
             self.llm.api_key is not None
         ), "You must provide an OpenAI API key to use the OpenAI LLM. Either pass it in the constructor, set the OPENAI_API_KEY environment variable, or create the file ~/.openai_api_key with your key in it."
 
+    def count_tokens(self, input_text: str, prompt: str) -> int:
+        enc = tiktoken.encoding_for_model(self.model)
+        return len(enc.encode(input_text + prompt + self.message))
+
+    def _endpoint(self, input_text: str, prompt: str, async_mode: bool = False):
+        available_tokens = self.max_tokens - self.count_tokens(input_text, prompt)
+        return guidance(  # type: ignore
+            self.message % available_tokens, llm=self.llm, async_mode=async_mode
+        )
+
     # note that guidance does caching, so I don't need to
     def automarkup(self, input_text: str, prompt: str, context=None) -> str:
         # Perform the automarkup
-        enc = tiktoken.encoding_for_model(self.model)
-        used_tokens = len(enc.encode(input_text + prompt + self.message))
-        available_tokens = self.max_tokens - used_tokens
-        endpoint = guidance(self.message % available_tokens, llm=self.llm)  # type: ignore
+        endpoint = self._endpoint(input_text, prompt)
         out = endpoint(input=input_text, prompt=prompt)
+        return self._extract_markup(out, context)
+
+    async def automarkup_async(self, input_text: str, prompt: str, context=None) -> str:
+        endpoint = self._endpoint(input_text, prompt, async_mode=True)
+        out = await endpoint(input=input_text, prompt=prompt)
+        return self._extract_markup(out, context)
 
+    def _extract_markup(self, out, context=None) -> str:
         if context and context.logger:
             context.logger.write_file("guidance_data.txt", str(out))
 
@@ -1,4 +1,4 @@
-from typing import Protocol
+from typing import IO, Iterator, Protocol
 from pathlib import Path
 
 
@@ -28,6 +28,31 @@ class MarkupEngine(Protocol):
         ...
 
 
+class AsyncMarkupEngine(MarkupEngine, Protocol):
+    """A markup engine which can run requests concurrently.
+
+    Engines that only implement `automarkup` are run in a worker thread.
+    """
+
+    async def automarkup_async(
+        self, input_text: str, prompt: str, config: Context
+    ) -> str:
+        ...
+
+    def count_tokens(self, input_text: str, prompt: str) -> int:
+        ...
+
+
 class Tokenizer(Protocol):
     def tokenize(self, xml_string: str) -> list[str]:
         ...
+
+
+class StreamingTokenizer(Tokenizer, Protocol):
+    """A tokenizer which can also tokenize a text stream as it reads it.
+
+    Tokenizers that only implement `tokenize` are given the whole document.
+    """
+
+    def iter_tokens(self, stream: IO[str]) -> Iterator[str]:
+        ...
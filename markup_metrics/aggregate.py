@@ -0,0 +1,142 @@
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# each resampling step draws at most this many indices at once, so memory
+# stays bounded however many files a schema has
+_CHUNK_ELEMENTS = 2**20
+
+
+class ScoreSummary(NamedTuple):
+    count: int
+    mean: float
+    median: Optional[float]
+    stddev: Optional[float]
+    ci_low: float
+    ci_high: float
+
+
+class PairedComparison(NamedTuple):
+    engine_a: str
+    engine_b: str
+    count: int
+    mean_difference: float
+    ci_low: float
+    ci_high: float
+    p_value: float
+
+
+def _chunks(resamples: int, n: int) -> List[int]:
+    size = max(1, _CHUNK_ELEMENTS // max(n, 1))
+    return [min(size, resamples - start) for start in range(0, resamples, size)]
+
+
+def bootstrap_means(
+    values: np.ndarray, resamples: int, rng: np.random.Generator
+) -> np.ndarray:
+    """The means of `resamples` resamples, with replacement, of `values`."""
+    n = len(values)
+    means = [
+        values[rng.integers(0, n, size=(chunk, n))].mean(axis=1)
+        for chunk in _chunks(resamples, n)
+    ]
+    return np.concatenate(means) if means else np.empty(0)
+
+
+def _interval(means: np.ndarray, fallback: float, confidence: float):
+    if not len(means):
+        return fallback, fallback
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def summarize_schemas(
+    scores: Mapping[str, Sequence[float]],
+    resamples: int,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> Dict[Optional[str], ScoreSummary]:
+    """Summaries of the scores of each schema, and of their average (key None).
+
+    The interval of the average of the schema means is taken from the same
+    resamples, averaged across schemas, so each schema keeps its weight.
+    """
+    rng = np.random.default_rng(seed)
+    summaries: Dict[Optional[str], ScoreSummary] = {}
+    schema_means = []
+    for schema, schema_scores in scores.items():
+        values = np.asarray(schema_scores, dtype=float)
+        means = bootstrap_means(values, resamples, rng)
+        schema_means.append(means)
+        mean = float(values.mean())
+        summaries[schema] = ScoreSummary(
+            len(values),
+            mean,
+            float(np.median(values)),
+            float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+            *_interval(means, mean, confidence),
+        )
+    if summaries:
+        mean = float(np.mean([summary.mean for summary in summaries.values()]))
+        summaries[None] = ScoreSummary(
+            sum(summary.count for summary in summaries.values()),
+            mean,
+            None,
+            None,
+            *_interval(np.mean(schema_means, axis=0), mean, confidence),
+        )
+    return summaries
+
+
+def compare_engines(
+    scores: Mapping[str, Mapping[str, float]],
+    resamples: int,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> List[PairedComparison]:
+    """Compare every pair of engines on the files that both of them scored.
+
+    `scores` maps each engine to its score per file. The interval is a
+    bootstrap interval of the mean difference, and the p-value is that of
+    a two-sided paired sign-flip permutation test of a zero mean difference.
+    """
+    rng = np.random.default_rng(seed)
+    engines = list(scores)
+    comparisons = []
+    for i, engine_a in enumerate(engines):
+        for engine_b in engines[i + 1 :]:
+            files = [path for path in scores[engine_a] if path in scores[engine_b]]
+            if not files:
+                continue
+            differences = np.array(
+                [scores[engine_a][path] - scores[engine_b][path] for path in files]
+            )
+            n = len(differences)
+            mean = float(differences.mean())
+            observed = abs(mean) - 1e-12
+            total = differences.sum()
+            extreme = 0
+            for chunk in _chunks(resamples, n):
+                # one random bit per difference: keep its sign if set, else
+                # flip it, so the flipped sum is 2 * (kept sum) - total
+                bits = np.unpackbits(
+                    rng.integers(0, 256, size=(chunk, -(-n // 8)), dtype=np.uint8),
+                    axis=1,
+                    count=n,
+                )
+                flipped = np.abs(2 * (bits @ differences) - total) / n
+                extreme += int((flipped >= observed).sum())
+            comparisons.append(
+                PairedComparison(
+                    engine_a,
+                    engine_b,
+                    n,
+                    mean,
+                    *_interval(
+                        bootstrap_means(differences, resamples, rng), mean, confidence
+                    ),
+                    (extreme + 1) / (resamples + 1),
+                )
+            )
+    return comparisons
@@ -0,0 +1,44 @@
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+import diskcache
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "markup_metrics"
+
+
+def hash_text(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        # length-prefix each part so that ("ab", "c") != ("a", "bc")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class AutomarkupCache:
+    """A size-bounded, least-recently-used on-disk cache of automarkup output."""
+
+    def __init__(self, directory: Path, size_limit: int) -> None:
+        self._cache = diskcache.Cache(
+            str(directory),
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+
+    @staticmethod
+    def key(source_hash: str, model: str, prompt: str, input_text: str) -> str:
+        return hash_text(source_hash, model, prompt, input_text)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, output_text: str) -> None:
+        self._cache.set(key, output_text)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def close(self) -> None:
+        self._cache.close()
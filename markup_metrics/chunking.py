@@ -0,0 +1,128 @@
+import re
+from typing import Callable, List, Optional, Set
+
+from lxml import etree
+
+# a block is a paragraph, list item or heading: text between blank lines
+_BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n")
+
+
+def split_text(
+    text: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> List[str]:
+    """Split text into chunks of at most `max_tokens`, on structural boundaries.
+
+    Chunks are made of whole blocks (separated by blank lines) where they
+    fit; a block that is too long on its own is split between lines, and
+    a line that is too long between words. Joining the chunks with blank
+    lines gives the text back, up to whitespace between blocks.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for block in _BLOCK_SEPARATOR.split(text.strip("\n")):
+        for piece in _split_block(block, max_tokens, count_tokens):
+            tokens = count_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_block(
+    block: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> List[str]:
+    if count_tokens(block) <= max_tokens:
+        return [block]
+    for separator in ("\n", " "):
+        parts = block.split(separator)
+        if len(parts) == 1:
+            continue
+        pieces: List[str] = []
+        for part in parts:
+            if pieces and count_tokens(pieces[-1] + separator + part) <= max_tokens:
+                pieces[-1] += separator + part
+            else:
+                pieces.append(part)
+        return [
+            piece
+            for part in pieces
+            for piece in _split_block(part, max_tokens, count_tokens)
+        ]
+    # a single word longer than a chunk
+    return [block]
+
+
+def chunk_prompt(prompt: str, index: int, count: int) -> str:
+    return (
+        f"{prompt}\n\nThe text is part {index + 1} of {count} of a longer document. "
+        "Mark it up as a complete document; the parts will be joined in order."
+    )
+
+
+def _repeated_tags(roots: List[etree._Element]) -> Set[str]:
+    """Tags that appear as consecutive siblings anywhere: list items like `step`."""
+    repeated = set()
+    for root in roots:
+        for element in root.iter():
+            tags = [child.tag for child in element]
+            repeated.update(a for a, b in zip(tags, tags[1:]) if a == b)
+    return repeated
+
+
+def _merge_children(
+    target: etree._Element, source: etree._Element, repeated: Set[str]
+) -> None:
+    """Append the children of `source` to `target`.
+
+    Parts are split between blocks, so a part's first child continues
+    `target`'s last child only if both are the same container that is not
+    a repeated item: the `steps` of a DITA task split across two parts are
+    merged, recursively, but their `step`s are kept apart.
+    """
+    children = list(source)
+    if (
+        children
+        and len(target)
+        and target[-1].tag == children[0].tag
+        and children[0].tag not in repeated
+        and len(target[-1])
+        and len(children[0])
+    ):
+        _merge_children(target[-1], children.pop(0), repeated)
+    for child in children:
+        target.append(child)
+
+
+def merge_documents(documents: List[str]) -> str:
+    """Merge marked-up parts of a document into one, under the first part's root.
+
+    The first part's XML declaration, DOCTYPE and root element are kept;
+    each later part must have a root of the same name. Raises ValueError
+    if a part is not well-formed or its root differs.
+    """
+    parser = etree.XMLParser(resolve_entities=False, load_dtd=False)
+    roots = []
+    for index, document in enumerate(documents):
+        try:
+            roots.append(etree.fromstring(document.encode("utf-8"), parser))
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f"Part {index + 1} is not well-formed: {e}") from e
+    merged = roots[0]
+    repeated = _repeated_tags(roots)
+    for index, root in enumerate(roots[1:], 2):
+        if root.tag != merged.tag:
+            raise ValueError(f"Part {index} has root {root.tag}, expected {merged.tag}")
+        _merge_children(merged, root, repeated)
+    docinfo = merged.getroottree().docinfo
+    doctype: Optional[str] = docinfo.doctype or None
+    return etree.tostring(
+        merged.getroottree(),
+        encoding="UTF-8",
+        xml_declaration=True,
+        doctype=doctype,
+    ).decode("utf-8")
@@ -1,77 +1,203 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
+import os
 from pathlib import Path
-from typing import List, Tuple
+import traceback
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union, cast
+from xml.sax import SAXParseException
 
 from prettytable import PrettyTable
 
+from markup_metrics.executor import SerialExecutor
 from markup_metrics.profile_logger import ProfileLogger
-from markup_metrics.tokenize_xml import tokenize_xml
-from markup_metrics.utils import load_engine
+from markup_metrics.tokenize_xml import XMLTokenizer
+from markup_metrics.utils import LazyEngine, load_engine
 from metric_engines.types import MetricEngine, MetricInput
 
 from .utils import setup_catalog_env_var
 
+# degradations from best to worst; those in the same tier are not ranked
+# against each other
+EXPECTED_RANKING = [["identical"], ["textchanged"], ["nomarkup", "notext"], ["empty"]]
 
-## TODO: Fix this code
 
+class TestCase(NamedTuple):
+    reference_file: Path
+    test_file: Path
+    # the test file's path relative to the data directory
+    name: str
+    metric_input: MetricInput
 
-def calculate_metrics(
-    datadir: Path, engines: List[MetricEngine], prof_log: ProfileLogger, out: Path
-) -> List[Tuple[str, str, str, float]]:
-    results = []
-    for ref_file in datadir.rglob("*reference.xml"):
-        ref_results = process_reference_set(
-            ref_file, ref_file.parent, engines, prof_log, out
-        )
-        results.extend(ref_results)
-    return results
 
+class Score(NamedTuple):
+    reference_file: str
+    test_file: str
+    engine: str
+    score: Optional[float]
 
-def process_reference_set(
-    ref_file: Path,
-    datadir: Path,
-    engines: List[MetricEngine],
-    prof_log: ProfileLogger,
-    out: Path,
-) -> List[Tuple[str, str, str, float]]:
-    ref_stem = ref_file.stem.split(".")[0]
-    results = []
-    for test_file in Path(datadir).glob(f"{ref_stem}.*.xml"):
-        if test_file.stem != ref_file.stem:
-            for engine in engines:
-                test_data = test_file.read_text()
-                reference_text = ref_file.read_text()
-                input = MetricInput(
+
+class RankAgreement(NamedTuple):
+    engine: str
+    pairs: int
+    agreed: int
+    tied: int
+    reversed: List[str]
+
+
+def degradation(test_file: Path) -> str:
+    return test_file.stem.split(".")[-1]
+
+
+def tier(test_file: Path) -> Optional[int]:
+    for index, kinds in enumerate(EXPECTED_RANKING):
+        if degradation(test_file) in kinds:
+            return index
+    return None
+
+
+def load_test_cases(
+    datadir: Path, tokenizer: XMLTokenizer, prof_log: ProfileLogger
+) -> List[TestCase]:
+    """Read and tokenize every reference and test file once."""
+    cases = []
+    for ref_file in sorted(datadir.rglob("*reference.xml")):
+        ref_stem = ref_file.stem.split(".")[0]
+        with prof_log.log_time(f"read {ref_file}", "read"):
+            reference_text = ref_file.read_text()
+            input_file = ref_file.parent / f"{ref_stem}.txt"
+            input_text = input_file.read_text() if input_file.exists() else ""
+        try:
+            with prof_log.log_time(f"tokenize {ref_file}", "tokenize"):
+                reference_tokens = tokenizer.tokenize(reference_text)
+        except SAXParseException as e:
+            print(f"Skipping {ref_file}: XML parsing failed: {e}")
+            continue
+        for test_file in sorted(ref_file.parent.glob(f"{ref_stem}.*.xml")):
+            if test_file.stem == ref_file.stem:
+                continue
+            with prof_log.log_time(f"read {test_file}", "read"):
+                test_text = test_file.read_text()
+            try:
+                with prof_log.log_time(f"tokenize {test_file}", "tokenize"):
+                    test_tokens = tokenizer.tokenize(test_text)
+            except SAXParseException as e:
+                print(f"Skipping {test_file}: XML parsing failed: {e}")
+                continue
+            cases.append(
+                TestCase(
+                    ref_file,
                     test_file,
-                    ref_file.read_text(),
-                    test_data,
-                    reference_text,
-                    tokenize_xml(test_data),
-                    tokenize_xml(reference_text),
-                    profile_logger=prof_log,
+                    str(test_file.relative_to(datadir)),
+                    MetricInput(
+                        input_file,
+                        input_text,
+                        test_text,
+                        reference_text,
+                        test_tokens,
+                        reference_tokens,
+                        # each engine's process logs to its own
+                        profile_logger=ProfileLogger(),
+                        reference_file=ref_file,
+                        hypothesis_file=test_file,
+                    ),
                 )
+            )
+    return cases
+
 
-                # Create a new path for the output file based on the "out" path and the name of the test file
-                output_file_path = out / (test_file.name + ".out")
-                output_file_path.mkdir(parents=True, exist_ok=True)
-                score = engine.calculate(input, output_file_path)
-                results.append((str(ref_file), test_file.name, engine.name, score))
+def score_test_cases(
+    metric_engine_script: str, cases: List[TestCase], out: Path
+) -> List[Score]:
+    """Score every test case with one metric engine."""
+    engine = load_engine(metric_engine_script, "MetricEngine")
+    if engine is None:
+        return []
+    prof_log = ProfileLogger()
+    results = []
+    for case in cases:
+        output_dir = out / f"{case.name}__{engine.name}"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            score: Optional[float] = engine.calculate(
+                case.metric_input._replace(profile_logger=prof_log), output_dir
+            )
+        except Exception as e:
+            print(f"Error: {engine.name} failed on {case.test_file}: {e}")
+            traceback.print_exc()
+            score = None
+        results.append(
+            Score(str(case.reference_file), case.test_file.name, engine.name, score)
+        )
     return results
 
 
+def rank_agreement(
+    engine: MetricEngine, cases: List[TestCase], scores: List[Score]
+) -> RankAgreement:
+    """How often the metric orders two degradations of a reference as expected.
+
+    Each pair of test files of the same reference in different tiers of
+    EXPECTED_RANKING is one comparison. Scores are better when higher, like
+    those of the built-in metrics, unless the engine sets
+    `higher_is_better = False`.
+    """
+    sign = 1 if getattr(engine, "higher_is_better", True) else -1
+    by_reference: Dict[Path, List[Tuple[int, str, float]]] = {}
+    for case, score in zip(cases, scores):
+        case_tier = tier(case.test_file)
+        if case_tier is not None and score.score is not None:
+            by_reference.setdefault(case.reference_file, []).append(
+                (case_tier, case.test_file.name, sign * score.score)
+            )
+    pairs = agreed = tied = 0
+    reversed_pairs = []
+    for ranked in by_reference.values():
+        for better_tier, better_name, better in ranked:
+            for worse_tier, worse_name, worse in ranked:
+                if better_tier >= worse_tier:
+                    continue
+                pairs += 1
+                if better > worse:
+                    agreed += 1
+                elif better == worse:
+                    tied += 1
+                else:
+                    reversed_pairs.append(f"{worse_name} > {better_name}")
+    return RankAgreement(engine.name, pairs, agreed, tied, reversed_pairs)
+
+
+def calculate_metrics(
+    cases: List[TestCase],
+    metric_engine_scripts: List[str],
+    out: Path,
+    jobs: int,
+) -> List[List[Score]]:
+    """Score the test cases with each metric engine, in parallel across engines."""
+    executor: Union[ProcessPoolExecutor, SerialExecutor] = (
+        ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else SerialExecutor()
+    )
+    with executor:
+        futures = [
+            executor.submit(score_test_cases, metric_engine_script, cases, out)
+            for metric_engine_script in metric_engine_scripts
+        ]
+        return [future.result() for future in futures]
+
+
 def main():
+    pkg_root = str(Path(__file__).parent.parent)
     parser = argparse.ArgumentParser(description="Test metrics against test cases.")
     parser.add_argument(
         "--metric-engines",
         type=str,
-        default="metrics/*_metric.py",
+        default=f"{pkg_root}/metric_engines/*_metric.py",
         help="Glob pattern for the scripts containing the MetricEngine classes.",
     )
     parser.add_argument(
         "--datadir",
         type=str,
-        default="./test_metrics/",
+        default=f"{pkg_root}/test_metrics/",
         help="Path to the data directory.",
     )
     parser.add_argument(
@@ -80,14 +206,21 @@ def main():
         default="./out/test_metrics",
         help="Path to the output directory.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of metric engines scored at once (default: one per "
+        "engine, up to the number of CPUs).",
+    )
 
     args = parser.parse_args()
-    metric_engine_scripts = glob(args.metric_engines)
+    metric_engine_scripts = sorted(glob(args.metric_engines))
+    # the engines are imported by the processes that score with them
     metric_engines = [
-        load_engine(metric_engine_script, "MetricEngine")
+        cast(MetricEngine, LazyEngine(metric_engine_script, "MetricEngine"))
         for metric_engine_script in metric_engine_scripts
     ]
-    metric_engines = [engine for engine in metric_engines if engine is not None]
 
     # Add a check if no metrics are found
     if not metric_engines:
@@ -105,12 +238,36 @@ def main():
     outdir.mkdir(parents=True, exist_ok=True)
     proflog = ProfileLogger()
     setup_catalog_env_var()
-    results = calculate_metrics(Path(args.datadir), metric_engines, proflog, outdir)
+    cases = load_test_cases(Path(args.datadir), XMLTokenizer(), proflog)
+    jobs = args.jobs or min(len(metric_engine_scripts), os.cpu_count() or 1)
+    results = calculate_metrics(cases, metric_engine_scripts, outdir, jobs)
 
     table = PrettyTable(["Reference File", "Test File", "Engine", "Score"])
-    for row in results:
-        table.add_row(row)
+    for engine_results in results:
+        for row in engine_results:
+            table.add_row(
+                [*row[:3], "error" if row.score is None else f"{row.score:.2f}"]
+            )
     print(table)
+
+    expected = " > ".join("/".join(kinds) for kinds in EXPECTED_RANKING)
+    agreement_table = PrettyTable(
+        ["Engine", "Pairs", "Agreed", "Tied", "Reversed", "Agreement"]
+    )
+    for engine, engine_results in zip(metric_engines, results):
+        agreement = rank_agreement(engine, cases, engine_results)
+        agreement_table.add_row(
+            [
+                agreement.engine,
+                agreement.pairs,
+                agreement.agreed,
+                agreement.tied,
+                "\n".join(agreement.reversed),
+                f"{agreement.agreed / agreement.pairs:.0%}" if agreement.pairs else "",
+            ]
+        )
+    print(f"Rank agreement with {expected}:")
+    print(agreement_table)
     print("Detailed information in", outdir)
 
 
@@ -0,0 +1,179 @@
+from fnmatch import fnmatchcase, translate
+import json
+import os
+from pathlib import Path
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+INDEX_VERSION = 1
+
+
+class DirectoryListing(NamedTuple):
+    mtime_ns: int
+    # (name, kind) in scandir order; kind is "dir" for directories that are
+    # walked, "link" for symlinks to directories, "file" or "other"
+    entries: List[List[str]]
+    # the text of prompt.txt, and its mtime, if there is one
+    prompt: Optional[str] = None
+    prompt_mtime_ns: Optional[int] = None
+
+
+def compile_filters(filter_list: Optional[List[str]]) -> Callable[[str], bool]:
+    """One matcher for all the patterns of a filter file.
+
+    A path matches if it ends with a path matching any of the patterns,
+    like `fnmatch(path, "*/" + pattern)` for each of them.
+    """
+    patterns = filter_list or ["*.txt"]
+    regex = re.compile("|".join(translate("*/" + pattern) for pattern in patterns))
+    return lambda path: regex.match(path) is not None
+
+
+class CorpusIndex:
+    """The schema directories of a corpus with their prompts, inputs and references.
+
+    The data directory is listed once per run instead of being globbed for
+    every engine, metric and input. With a `cache_file`, the listings are
+    kept between runs, and a directory is only listed again if its mtime
+    changed (adding, removing or renaming a file changes its directory's
+    mtime), so an unchanged corpus costs one stat per directory.
+    """
+
+    def __init__(
+        self,
+        datadir: Path,
+        filter_list: Optional[List[str]] = None,
+        cache_file: Optional[Path] = None,
+    ) -> None:
+        self.datadir = datadir
+        self.matches = compile_filters(filter_list)
+        self.cache_file = cache_file
+        self._listings: Dict[str, DirectoryListing] = {}
+        self._cached: Dict[str, DirectoryListing] = self._load_cache()
+        self._inputs: Dict[Path, List[Path]] = {}
+        self._schema_dirs = self._walk()
+        self._save_cache()
+
+    def _load_cache(self) -> Dict[str, DirectoryListing]:
+        if not self.cache_file or not self.cache_file.exists():
+            return {}
+        try:
+            data = json.loads(self.cache_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return {
+            directory: DirectoryListing(*listing)
+            for directory, listing in data["directories"].items()
+        }
+
+    def _save_cache(self) -> None:
+        if not self.cache_file or self._listings == self._cached:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        data: Dict[str, Any] = {
+            "version": INDEX_VERSION,
+            "directories": {
+                directory: list(listing)
+                for directory, listing in self._listings.items()
+            },
+        }
+        temporary = self.cache_file.with_suffix(".tmp")
+        temporary.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temporary, self.cache_file)
+
+    def _key(self, directory: Path) -> str:
+        return str(directory.relative_to(self.datadir))
+
+    def _listing(self, directory: Path) -> DirectoryListing:
+        key = self._key(directory)
+        listing = self._listings.get(key)
+        if listing is not None:
+            return listing
+        mtime_ns = directory.stat().st_mtime_ns
+        listing = self._cached.get(key)
+        if listing is None or listing.mtime_ns != mtime_ns:
+            listing = DirectoryListing(mtime_ns, self._scan(directory))
+        prompt_path = directory / "prompt.txt"
+        if any(name == "prompt.txt" for name, _ in listing.entries):
+            prompt_mtime_ns = prompt_path.stat().st_mtime_ns
+            if listing.prompt is None or listing.prompt_mtime_ns != prompt_mtime_ns:
+                with prompt_path.open("r") as file:
+                    listing = listing._replace(
+                        prompt=file.read(), prompt_mtime_ns=prompt_mtime_ns
+                    )
+        self._listings[key] = listing
+        return listing
+
+    @staticmethod
+    def _scan(directory: Path) -> List[List[str]]:
+        entries = []
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_dir():
+                    kind = "link" if entry.is_symlink() else "dir"
+                elif entry.is_file():
+                    kind = "file"
+                else:
+                    kind = "other"
+                entries.append([entry.name, kind])
+        return entries
+
+    def _walk(self) -> List[Path]:
+        # in the order of `datadir.rglob("*")`: the subdirectories of each
+        # directory, for each directory in preorder
+        schema_dirs = []
+
+        def visit(directory: Path) -> None:
+            entries = self._listing(directory).entries
+            schema_dirs.extend(
+                directory / name for name, kind in entries if kind in ("dir", "link")
+            )
+            for name, kind in entries:
+                if kind == "dir":
+                    visit(directory / name)
+
+        visit(self.datadir)
+        return schema_dirs
+
+    def schema_dirs(self) -> List[Path]:
+        return self._schema_dirs
+
+    def prompt(self, schema_dir: Path) -> str:
+        return self._listing(schema_dir).prompt or ""
+
+    def input_files(self, schema_dir: Path) -> List[Path]:
+        """The input texts of a schema that match the filters."""
+        inputs = self._inputs.get(schema_dir)
+        if inputs is None:
+            inputs = self._inputs[schema_dir] = [
+                schema_dir / name
+                for name, kind in self._listing(schema_dir).entries
+                if kind == "file"
+                and fnmatchcase(name, "*.txt")
+                and name != "prompt.txt"
+                and self.matches(str((schema_dir / name).absolute()))
+            ]
+        return inputs
+
+    def reference_paths(self, txt_path: Path, operation: str = "") -> List[Path]:
+        extension = f"{operation}.xml" if operation else "xml"
+        names = [name for name, _ in self._listing(txt_path.parent).entries]
+        return [
+            txt_path.parent / name
+            for pattern in (
+                f"{txt_path.stem}.{extension}",
+                f"{txt_path.stem}.[0-9]*.{extension}",
+            )
+            for name in names
+            if fnmatchcase(name, pattern)
+        ]
+
+    def refresh(self, directory: Path) -> None:
+        """List a directory again after files were added to it."""
+        self._listings.pop(self._key(directory), None)
+        self._cached.pop(self._key(directory), None)
+        self._inputs.pop(directory, None)
+        self._listing(directory)
+        self._save_cache()
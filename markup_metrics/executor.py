@@ -0,0 +1,53 @@
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeferredFuture(Generic[T]):
+    """A future which runs its function the first time the result is requested.
+
+    This keeps serial runs interleaved exactly as they were before work
+    was split into units: each unit is computed at the point it is reported.
+    """
+
+    def __init__(self, fn: Callable[..., T], *args: Any) -> None:
+        self._fn = fn
+        self._args = args
+        self._done = False
+        self._result: Optional[T] = None
+        self._exception: Optional[BaseException] = None
+
+    def result(self) -> T:
+        if not self._done:
+            try:
+                self._result = self._fn(*self._args)
+            except BaseException as e:
+                self._exception = e
+            self._done = True
+            # the arguments, such as a batch's hypotheses, are no longer needed
+            self._args = ()
+        if self._exception is not None:
+            raise self._exception
+        return self._result  # type: ignore
+
+
+class CompletedFuture(Generic[T]):
+    def __init__(self, result: T) -> None:
+        self._result = result
+
+    def result(self) -> T:
+        return self._result
+
+
+class SerialExecutor:
+    def submit(self, fn: Callable[..., T], *args: Any) -> DeferredFuture[T]:
+        return DeferredFuture(fn, *args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+    def __enter__(self) -> "SerialExecutor":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
@@ -1,24 +1,35 @@
 import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import csv
-from fnmatch import fnmatch
 import glob
+import hashlib
+import io
+import json
+import math
 from pyexpat import ExpatError
 import shutil
-import statistics
+import sys
 import time
 from pathlib import Path
 import traceback
 from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
     List,
     NamedTuple,
     Optional,
     Protocol,
+    Sequence,
+    TextIO,
     Tuple,
+    Union,
     cast,
 )
 from xml.etree.ElementTree import parse
 from xml.sax import SAXParseException
-import yaml
 
 from prettytable import PrettyTable
 
@@ -27,11 +38,30 @@ from markup_engines.types import (
     Tokenizer as TokenizerProtocol,
     Context as MarkupEngineContext,
 )
-from markup_metrics.profile_logger import ProfileLogger
-from markup_metrics.tokenize_xml import XMLTokenizer
-from metric_engines.types import MetricInput, MetricEngine
+from markup_metrics.automarkup_cache import (
+    DEFAULT_CACHE_DIR,
+    AutomarkupCache,
+    hash_text,
+)
+from markup_metrics.chunking import chunk_prompt, merge_documents, split_text
+from markup_metrics.corpus import CorpusIndex
+from markup_metrics.executor import CompletedFuture, SerialExecutor
+from markup_metrics.manifest import RunManifest, script_hash
+from markup_metrics.profile_logger import ProfileLog, ProfileLogger
+from markup_metrics.scheduler import AutomarkupScheduler, estimate_tokens
+from markup_metrics.score_cache import ScoreCache
+from markup_metrics.token_cache import CachingTokenizer
+from markup_metrics.vocabulary import Vocabulary
+from markup_metrics.tokenize_xml import ExpatTokenizer, XMLTokenizer, iter_tokens
+from metric_engines.types import (
+    ARTIFACT_LEVELS,
+    BatchMetricEngine,
+    BoundedMetricEngine,
+    MetricInput,
+    MetricEngine,
+)
 
-from .utils import load_engine, setup_catalog_env_var
+from .utils import EngineUnavailable, LazyEngine, load_engine, setup_catalog_env_var
 
 
 class LogResult(NamedTuple):
@@ -45,18 +75,47 @@ class LogResult(NamedTuple):
     reference_text: str
 
 
+class ResultsWriter:
+    """Appends each result to `results.csv` as soon as it is known."""
+
+    def __init__(self, path: Path) -> None:
+        self.file = path.open("w", newline="")
+        self.csv_writer = csv.writer(self.file)
+        self.csv_writer.writerow(LogResult._fields)
+        self.file.flush()
+
+    def write(self, row: LogResult) -> None:
+        self.csv_writer.writerow(row)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
 class SimpleLogger:
-    def __init__(self, outdir: Path) -> None:
+    def __init__(self, outdir: Path, results: bool = False) -> None:
+        """`results` is true for the run's logger, which writes results.csv."""
         self.outdir = outdir
-        filename = outdir / "log.txt"
-        self.file = filename.open("w")
-        self._results = []
+        self.filename = outdir / "log.txt"
+        self.filename.write_text("")
+        # opened on the first message, so that idle loggers, such as those of
+        # queued automarkup chunks, don't hold a file open
+        self.file: Optional[TextIO] = None
+        self.results = ResultsWriter(outdir / "results.csv") if results else None
+        self.reports: Optional[TextIO] = None
 
     def close(self):
-        self.file.close()
+        if self.file:
+            self.file.close()
+        if self.results:
+            self.results.close()
+        if self.reports:
+            self.reports.close()
 
     def log(self, *message: str) -> None:
         joined = " ".join(str(m) for m in message)
+        if self.file is None:
+            self.file = self.filename.open("a")
         self.file.write(joined + "\n")
         self.file.flush()
         print(joined)
@@ -65,8 +124,65 @@ class SimpleLogger:
         with open(self.outdir / name, "w", encoding="utf-8") as file:
             file.write(contents)
 
-    def log_result(self, row):
-        self._results.append(row)
+    def log_result(self, row: LogResult) -> None:
+        cast(ResultsWriter, self.results).write(row)
+
+    def report(self, record: Dict[str, Any]) -> None:
+        self._write_report(json.dumps(record))
+
+    def _write_report(self, line: str) -> None:
+        if self.reports is None:
+            self.reports = (self.outdir / "reports.jsonl").open("w", encoding="utf-8")
+        self.reports.write(line + "\n")
+
+    def print_exc(self) -> None:
+        traceback.print_exc()
+
+    def replay(self, records: List[Tuple[str, str]]) -> None:
+        for kind, text in records:
+            if kind == "traceback":
+                sys.stderr.write(text)
+            elif kind == "report":
+                self._write_report(text)
+            else:
+                self.log(text)
+
+
+def read_reports(path: Path) -> Dict[Tuple[str, str], List[str]]:
+    """The lines of a reports.jsonl, by metric engine and hypothesis file."""
+    reports: Dict[Tuple[str, str], List[str]] = {}
+    if path.exists():
+        with path.open("r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a crashed run may be incomplete
+                    continue
+                key = (record["metric_engine"], record["hypothesis_file"])
+                reports.setdefault(key, []).append(line.rstrip("\n"))
+    return reports
+
+
+class BufferedLogger:
+    """Collects log output from a scoring unit so the parent can replay it in order."""
+
+    def __init__(self, outdir: Path) -> None:
+        self.outdir = outdir
+        self.records: List[Tuple[str, str]] = []
+
+    def log(self, *message: str) -> None:
+        self.records.append(("log", " ".join(str(m) for m in message)))
+
+    def write_file(self, name: str, contents: str) -> None:
+        with open(self.outdir / name, "w", encoding="utf-8") as file:
+            file.write(contents)
+
+    def print_exc(self) -> None:
+        self.records.append(("traceback", traceback.format_exc()))
+
+    def report(self, record: Dict[str, Any]) -> None:
+        self.records.append(("report", json.dumps(record)))
 
 
 class Config(NamedTuple):
@@ -75,242 +191,1006 @@ class Config(NamedTuple):
     datadir: Path
     outdir: Path
     tokenizer: TokenizerProtocol
-    logger: SimpleLogger
+    logger: Union[SimpleLogger, BufferedLogger]
     prof_logger: ProfileLogger
     filter_list: Optional[List[str]]
     operation: str  # maybe this should be inferred from the engine instead
     halt_on_error: bool
     save_as_test_cases: bool = False
+    jobs: int = 1
+    tokenizer_spec: str = "xml"
+    max_in_flight: int = 1
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    automarkup_cache: Optional[AutomarkupCache] = None
+    token_cache_dir: Optional[Path] = None
+    vocabulary: Optional[Vocabulary] = None
+    manifest: Optional[RunManifest] = None
+    results_texts: str = "inline"
+    report_format: str = "jsonl"
+    bootstrap_resamples: int = 2000
+    chunk_tokens: Optional[int] = None
+    corpus: Optional[CorpusIndex] = None
+    score_cache: Optional[ScoreCache] = None
+    artifacts: str = "full"
+    prune_references: bool = False
+    # the reports.jsonl lines of the run being resumed
+    previous_reports: Optional[Dict[Tuple[str, str], List[str]]] = None
 
     def close(self):
-        self.logger.close()
+        cast(SimpleLogger, self.logger).close()
+        if self.manifest:
+            self.manifest.close()
+        if self.automarkup_cache:
+            self.automarkup_cache.close()
+        if self.score_cache:
+            self.score_cache.close()
+        if isinstance(self.tokenizer, CachingTokenizer):
+            self.tokenizer.close()
 
 
-def parse_prompt(schema_dir: Path) -> str:
-    prompt_path = schema_dir / "prompt.txt"
-    if prompt_path.exists():
-        with prompt_path.open("r") as file:
-            return file.read()
-    else:
-        return ""
+def corpus_index(config: Config) -> CorpusIndex:
+    return cast(CorpusIndex, config.corpus)
+
+
+def tokenize_document(
+    tokenizer: TokenizerProtocol, text: str, path: Path, streaming: bool
+) -> List[str]:
+    """Tokenize a document, or only check that it parses for streaming metrics."""
+    if not streaming:
+        return tokenizer.tokenize(text)
+    with path.open("r") as stream:
+        for _ in iter_tokens(tokenizer, stream):
+            pass
+    return []
 
 
 def parse_reference_text(
-    xml_path: Path, tokenizer: TokenizerProtocol, logger: SimpleLogger
-) -> Optional[str]:
-    try:
+    xml_path: Path,
+    tokenizer: TokenizerProtocol,
+    logger: Union[SimpleLogger, BufferedLogger],
+    prof_logger: ProfileLogger,
+    streaming: bool = False,
+) -> Optional[Tuple[str, List[str]]]:
+    with prof_logger.log_time(f"read {xml_path}", "read"):
         with xml_path.open("r") as file:
             reference_text = file.read()
-            tokenizer.tokenize(reference_text)
-            return reference_text
+    try:
+        with prof_logger.log_time(f"tokenize {xml_path}", "tokenize"):
+            return reference_text, tokenize_document(
+                tokenizer, reference_text, xml_path, streaming
+            )
     except SAXParseException:
         logger.log(f"Error: XML parsing failed for {xml_path}")
         return None
 
 
+class Hypothesis(NamedTuple):
+    output_file_path: Optional[Path]
+    output_text: Optional[str]
+    error: Optional[Exception] = None
+
+
+def find_reference_paths(txt_path: Path, config: Config) -> List[Path]:
+    return corpus_index(config).reference_paths(txt_path, config.operation)
+
+
 def process_file(
     txt_path: Path,
-    automarkup,
+    hypothesis: Hypothesis,
+    automarkup: MarkupEngine,
     metric_engine,
-    prompt: str,
-    engine_outdir: Path,
+    scoring_futures: Dict[Tuple[str, Path], "PendingScore"],
     config: Config,
-) -> Tuple[float, bool, Optional[Path], Optional[MetricInput]]:
-    if config.operation:
-        extension = f"{config.operation}.xml"
-    else:
-        extension = "xml"
+) -> Tuple[float, bool, Optional[Path], Tuple[str, str, str]]:
+    if hypothesis.error is not None:
+        config.logger.log(f"            Error: {hypothesis.error} for {txt_path}")
+        return (0, False, None, ("", "", ""))
+
+    # popped, so that a batch's results are freed once their rows are written
+    pending = scoring_futures.pop((metric_engine.name, txt_path), None)
+    if pending is None:
+        return (0, False, None, ("", "", ""))
+
+    scoring = cast(ScoringResult, pending.future.result()[pending.index])
+    cast(SimpleLogger, config.logger).replay(scoring.records)
+    config.prof_logger.times.extend(scoring.times)
+    if config.manifest and not pending.resumed:
+        config.manifest.record(
+            "score",
+            [automarkup.name, metric_engine.name, str(txt_path)],
+            pending.fingerprint,
+            {
+                "score": scoring.score,
+                "success": scoring.success,
+                "output_file": str(scoring.output_file_path)
+                if scoring.output_file_path
+                else None,
+                "reference": str(scoring.reference_path)
+                if scoring.reference_path
+                else None,
+                # reports are carried over from reports.jsonl on resume
+                "records": [
+                    (kind, text) for kind, text in scoring.records if kind != "report"
+                ],
+                "reports": sum(kind == "report" for kind, _ in scoring.records),
+            },
+        )
+    return (scoring.score, scoring.success, scoring.output_file_path, scoring.texts)
 
-    xml_paths = list(txt_path.parent.glob(f"{txt_path.stem}.{extension}")) + list(
-        txt_path.parent.glob(f"{txt_path.stem}.[0-9]*.{extension}")
-    )
 
-    # save the output of the markup engines as test cases if there are none
-    try:
-        output_file_path, output_text = do_automarkup(
-            txt_path, prompt, engine_outdir, automarkup, config
-        )
-    except (UnicodeDecodeError, SAXParseException, ExpatError, ValueError) as e:
-        config.logger.log(f"            Error: {e} for {txt_path}")
-        return (0, False, None, None)
+class ScoringUnit(NamedTuple):
+    metric_engine_name: str
+    txt_path: Path
+    xml_paths: List[Path]
+    output_file_path: Path
+    output_text: str
 
-    if config.save_as_test_cases and not xml_paths:
-        (txt_path.parent / f"{txt_path.stem}.{extension}").write_text(output_text)
 
-    results = [
-        compare_with_reference_safe(
-            xml_path,
-            txt_path,
-            metric_engine,
-            output_file_path,
-            output_text,
-            config,
+class ScoringResult(NamedTuple):
+    # kept small: it is sent back by the workers with --jobs and held until
+    # its row of results.csv is written
+    score: float
+    success: bool
+    output_file_path: Optional[Path]
+    reference_path: Optional[Path]
+    # the input, hypothesis and reference columns of its results.csv row
+    texts: Tuple[str, str, str]
+    records: List[Tuple[str, str]]
+    times: List[ProfileLog]
+
+
+class PendingScore(NamedTuple):
+    # a future of the results of a batch of units
+    future: Any
+    index: int
+    fingerprint: str
+    resumed: bool = False
+
+
+# State of the process that runs scoring units: the main process for
+# serial runs, or each worker of the pool when running with --jobs.
+_scoring_config: Optional[Config] = None
+_scoring_metric_engines: Dict[str, MetricEngine] = {}
+
+
+def set_scoring_state(config: Config, metric_engines: List[MetricEngine]) -> None:
+    global _scoring_config
+    _scoring_config = config
+    _scoring_metric_engines.clear()
+    _scoring_metric_engines.update((engine.name, engine) for engine in metric_engines)
+
+
+def init_scoring_worker(config: Config, metric_engine_scripts: List[str]) -> None:
+    metric_engines = [
+        cast(MetricEngine, LazyEngine(metric_engine_script, "MetricEngine"))
+        for metric_engine_script in metric_engine_scripts
+    ]
+    tokenizer = CachingTokenizer(
+        make_tokenizer(config.tokenizer_spec), config.token_cache_dir
+    )
+    set_scoring_state(config._replace(tokenizer=tokenizer), metric_engines)
+
+
+def score_units(units: List[ScoringUnit]) -> List[ScoringResult]:
+    """Score hypotheses against each of their references with one metric.
+
+    Every reference of every unit is prepared first, tokenizing each
+    hypothesis once. The metric is then given the first reference of every
+    unit as one batch, then the second, and so on: all references of an
+    input share the same metric output directory, so they must be scored
+    one after the other. With `prune_references`, a metric that can bound
+    its scores gets each unit's references from the highest bound down,
+    and those bounded below the unit's best score so far are skipped: they
+    cannot be the best reference.
+    """
+    config = cast(Config, _scoring_config)
+    metric_engine = _scoring_metric_engines[units[0].metric_engine_name]
+    unit_configs = [
+        config._replace(
+            logger=BufferedLogger(config.outdir), prof_logger=ProfileLogger()
         )
-        for xml_path in xml_paths
+        for _ in units
     ]
-    return max(results) if results else (0, False, None, None)
-
+    failed: Tuple[float, bool, Optional[Path], Optional[MetricInput]] = (
+        0,
+        False,
+        None,
+        None,
+    )
+    # the result for each reference of each unit, None if it was skipped
+    results: List[
+        List[Optional[Tuple[float, bool, Optional[Path], Optional[MetricInput]]]]
+    ]
+    results = [[failed] * len(unit.xml_paths) for unit in units]
+    prune = config.prune_references and hasattr(metric_engine, "score_upper_bound")
+
+    comparisons: List[Dict[int, Comparison]] = []
+    bounds: List[Dict[int, float]] = []
+    orders: List[List[int]] = []
+    for unit, unit_config in zip(units, unit_configs):
+        tokenize_hypothesis = hypothesis_tokenizer(
+            metric_engine, unit.output_file_path, unit.output_text, unit_config
+        )
+        prepared: Dict[int, Comparison] = {}
+        for index, xml_path in enumerate(unit.xml_paths):
+            try:
+                with unit_config.prof_logger.log_time(
+                    f"prepare {unit.txt_path} with {xml_path.name}",
+                    "prepare",
+                    metric_engine.name,
+                ):
+                    comparison = prepare_comparison(
+                        xml_path,
+                        unit.txt_path,
+                        metric_engine,
+                        unit.output_file_path,
+                        unit.output_text,
+                        tokenize_hypothesis,
+                        unit_config,
+                    )
+            except Exception as e:
+                log_scoring_error(e, unit_config)
+                comparison = None
+            if comparison is not None:
+                prepared[index] = comparison
+        unit_bounds: Dict[int, float] = {}
+        if prune and len(prepared) > 1:
+            for index, comparison in prepared.items():
+                try:
+                    with unit_config.prof_logger.log_time(
+                        f"bound {unit.txt_path} with {unit.xml_paths[index].name}",
+                        "prepare",
+                        metric_engine.name,
+                    ):
+                        unit_bounds[index] = cast(
+                            BoundedMetricEngine, metric_engine
+                        ).score_upper_bound(comparison.metric_input)
+                except Exception as e:
+                    log_scoring_error(e, unit_config)
+        comparisons.append(prepared)
+        bounds.append(unit_bounds)
+        # a stable sort, so without bounds the references keep their order
+        orders.append(
+            sorted(prepared, key=lambda index: -unit_bounds.get(index, math.inf))
+        )
 
-def compare_with_reference_safe(
-    xml_path,
-    txt_path,
-    metric_engine,
-    output_file_path,
-    output_text,
-    config,
-) -> Tuple[float, bool, Optional[Path], Optional[MetricInput]]:
-    try:
-        result = compare_with_reference(
-            xml_path,
-            txt_path,
+    best_scores: List[Optional[float]] = [None for _ in units]
+    for position in range(max((len(order) for order in orders), default=0)):
+        batch: List[Tuple[int, int, Comparison]] = []
+        for i, order in enumerate(orders):
+            if position >= len(order):
+                continue
+            index = order[position]
+            bound = bounds[i].get(index)
+            best = best_scores[i]
+            if bound is not None and best is not None and bound < best:
+                results[i][index] = None
+                continue
+            batch.append((i, index, comparisons[i][index]))
+
+        scores = calculate_scores(
             metric_engine,
-            output_file_path,
-            output_text,
-            config,
+            [comparison for _, _, comparison in batch],
+            [unit_configs[i] for i, _, _ in batch],
         )
-    except Exception as e:
-        if config.halt_on_error:
-            raise e
-        config.logger.log(f"            Error: {e}")
-        traceback.print_exc()
-        result = 0, False, None, None
-    return result
+        for (i, index, comparison), score in zip(batch, scores):
+            unit_config = unit_configs[i]
+            if score is None:
+                continue
+            try:
+                with unit_config.prof_logger.log_time(
+                    f"report {comparison.metric_output.name}",
+                    "report",
+                    metric_engine.name,
+                ):
+                    write_report(
+                        comparison.metric_input,
+                        metric_engine,
+                        comparison.output_file_path,
+                        comparison.metric_output,
+                        score,
+                        unit_config,
+                    )
+            except Exception as e:
+                log_scoring_error(e, unit_config)
+                continue
+            results[i][index] = (
+                score,
+                True,
+                comparison.output_file_path,
+                comparison.metric_input,
+            )
+            best = best_scores[i]
+            if best is None or score > best:
+                best_scores[i] = score
+
+    scorings = []
+    for unit, unit_config, unit_results in zip(units, unit_configs, results):
+        scored = {
+            i: result for i, result in enumerate(unit_results) if result is not None
+        }
+        best = max(scored, key=lambda i: scored[i])
+        score, success, output_file_path, metric_input = scored[best]
+        scorings.append(
+            ScoringResult(
+                score,
+                success,
+                output_file_path,
+                unit.xml_paths[best] if success else None,
+                result_texts(metric_input, output_file_path, unit_config),
+                cast(BufferedLogger, unit_config.logger).records,
+                unit_config.prof_logger.times,
+            )
+        )
+    return scorings
+
+
+def make_scoring_executor(
+    config: Config, metric_engines: List[MetricEngine]
+) -> Union[ProcessPoolExecutor, SerialExecutor]:
+    if config.jobs > 1:
+        # loggers hold open files and custom tokenizers may not pickle,
+        # so workers get a stripped config and rebuild the tokenizer
+        worker_config = config._replace(
+            logger=None,
+            prof_logger=None,
+            tokenizer=None,
+            manifest=None,
+            corpus=None,
+            previous_reports=None,
+        )
+        return ProcessPoolExecutor(
+            max_workers=config.jobs,
+            initializer=init_scoring_worker,
+            initargs=(worker_config, config.metric_engine_scripts),
+        )
+    set_scoring_state(config, metric_engines)
+    return SerialExecutor()
+
+
+def scoring_fingerprint(
+    metric_engine: MetricEngine,
+    txt_path: Path,
+    xml_paths: List[Path],
+    output_text: str,
+    config: Config,
+) -> str:
+    """Hash everything that a metric's score of one hypothesis depends on."""
+    tokenizer_id = getattr(config.tokenizer, "identity", config.tokenizer_spec)
+    return hash_text(
+        script_hash(metric_engine.script),
+        tokenizer_id,
+        config.artifacts,
+        config.report_format,
+        txt_path.read_text(),
+        output_text,
+        *(
+            part
+            for xml_path in xml_paths
+            for part in (str(xml_path), xml_path.read_text())
+        ),
+    )
+
+
+def resumed_score(
+    data: Dict[str, Any], unit: ScoringUnit, reports: List[str], config: Config
+) -> ScoringResult:
+    """Rebuild the result of a scoring unit recorded by an earlier run."""
+    reference_path = Path(data["reference"]) if data["reference"] else None
+    metric_input = None
+    if reference_path is not None:
+        metric_input = MetricInput(
+            unit.txt_path,
+            unit.txt_path.read_text(),
+            unit.output_text,
+            reference_path.read_text(),
+            [],
+            [],
+            profile_logger=ProfileLogger(),
+            reference_file=reference_path,
+        )
+    output_file = Path(data["output_file"]) if data["output_file"] else None
+    return ScoringResult(
+        data["score"],
+        data["success"],
+        output_file,
+        reference_path,
+        result_texts(metric_input, output_file, config),
+        [(kind, text) for kind, text in data["records"]]
+        + [("report", line) for line in reports],
+        [],
+    )
+
+
+def submit_scoring_units(
+    markup_engine: MarkupEngine,
+    metric_engines: List[MetricEngine],
+    hypotheses: Dict[Path, Hypothesis],
+    executor: Union[ProcessPoolExecutor, SerialExecutor],
+    config: Config,
+) -> Dict[Tuple[str, Path], PendingScore]:
+    reference_paths = {}
+    for txt_path, hypothesis in hypotheses.items():
+        if hypothesis.error is not None:
+            continue
+        xml_paths = find_reference_paths(txt_path, config)
+        # save the output of the markup engines as test cases if there are none
+        if config.save_as_test_cases and not xml_paths:
+            extension = f"{config.operation}.xml" if config.operation else "xml"
+            (txt_path.parent / f"{txt_path.stem}.{extension}").write_text(
+                cast(str, hypothesis.output_text)
+            )
+            corpus_index(config).refresh(txt_path.parent)
+            xml_paths = find_reference_paths(txt_path, config)
+        reference_paths[txt_path] = xml_paths
+
+    # submitted in the order the results are reported, so that the first
+    # results needed are the first to be computed
+    futures: Dict[Tuple[str, Path], PendingScore] = {}
+    fingerprints: Dict[Path, str] = {}
+    for metric_engine in metric_engines:
+        batch: List[ScoringUnit] = []
+        for txt_path, xml_paths in reference_paths.items():
+            if not xml_paths:
+                continue
+            hypothesis = hypotheses[txt_path]
+            unit = ScoringUnit(
+                metric_engine.name,
+                txt_path,
+                xml_paths,
+                cast(Path, hypothesis.output_file_path),
+                cast(str, hypothesis.output_text),
+            )
+            fingerprint = ""
+            if config.manifest:
+                fingerprint = scoring_fingerprint(
+                    metric_engine, txt_path, xml_paths, unit.output_text, config
+                )
+                data = config.manifest.get(
+                    "score",
+                    [markup_engine.name, metric_engine.name, str(txt_path)],
+                    fingerprint,
+                )
+                reports = (config.previous_reports or {}).get(
+                    (metric_engine.name, str(unit.output_file_path)), []
+                )
+                # rescore if the earlier run's reports were lost
+                if data is not None and data.get("reports") == len(reports):
+                    futures[(metric_engine.name, txt_path)] = PendingScore(
+                        CompletedFuture([resumed_score(data, unit, reports, config)]),
+                        0,
+                        fingerprint,
+                        True,
+                    )
+                    continue
+            batch.append(unit)
+            fingerprints[txt_path] = fingerprint
+        for units in batch_units(batch, config.jobs):
+            future = executor.submit(score_units, units)
+            for index, unit in enumerate(units):
+                futures[(metric_engine.name, unit.txt_path)] = PendingScore(
+                    future, index, fingerprints[unit.txt_path]
+                )
+    return futures
+
+
+def batch_units(units: List[ScoringUnit], jobs: int) -> Iterator[List[ScoringUnit]]:
+    """Split units into batches of one schema directory each.
+
+    With several jobs, each directory is split in as many batches, so that
+    all the workers have something to do.
+    """
+    by_schema: Dict[Path, List[ScoringUnit]] = {}
+    for unit in units:
+        by_schema.setdefault(unit.txt_path.parent, []).append(unit)
+    for schema_units in by_schema.values():
+        size = -(-len(schema_units) // jobs)
+        for start in range(0, len(schema_units), size):
+            yield schema_units[start : start + size]
+
+
+def log_scoring_error(e: Exception, config: Config, note: str = "") -> None:
+    if config.halt_on_error:
+        raise e
+    config.logger.log(f"            Error: {e}{note}")
+    config.logger.print_exc()
 
 
 counter = 0
 
 
-def compare_with_reference(
+class Comparison(NamedTuple):
+    metric_input: MetricInput
+    metric_output: Path
+    output_file_path: Path
+
+
+def hypothesis_tokenizer(
+    metric_engine: MetricEngine,
+    output_file_path: Path,
+    output_text: str,
+    config: Config,
+) -> Callable[[], Tuple[List[str], Optional[Sequence[int]]]]:
+    """Tokenize (and intern) a hypothesis on first use, once for all references.
+
+    The returned function raises SAXParseException every time it is called
+    if the hypothesis does not parse.
+    """
+    streaming = getattr(metric_engine, "streams_tokens", False)
+    result: List[Union[Tuple[List[str], Optional[Sequence[int]]], Exception]] = []
+
+    def tokenize() -> Tuple[List[str], Optional[Sequence[int]]]:
+        if not result:
+            try:
+                with config.prof_logger.log_time(
+                    f"tokenize {output_file_path}", "tokenize"
+                ):
+                    tokens = tokenize_document(
+                        config.tokenizer, output_text, output_file_path, streaming
+                    )
+                    ids = None
+                    if config.vocabulary is not None and not streaming:
+                        ids = config.vocabulary.intern(tokens)
+            except SAXParseException as e:
+                result.append(e)
+            else:
+                result.append((tokens, ids))
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    return tokenize
+
+
+def prepare_comparison(
     xml_path: Path,
     txt_path: Path,
     metric_engine,
     output_file_path: Path,
     output_text: str,
+    tokenize_hypothesis: Callable[[], Tuple[List[str], Optional[Sequence[int]]]],
     config: Config,
-) -> Tuple[float, bool, Optional[Path], Optional[MetricInput]]:
-    reference_text = parse_reference_text(xml_path, config.tokenizer, config.logger)
-    if reference_text is None:
-        return 0, False, None, None
+) -> Optional[Comparison]:
+    prof_logger = config.prof_logger
+    streaming = getattr(metric_engine, "streams_tokens", False)
+    reference = parse_reference_text(
+        xml_path, config.tokenizer, config.logger, prof_logger, streaming
+    )
+    if reference is None:
+        return None
+    reference_text, reference_tokens = reference
 
     try:
-        config.tokenizer.tokenize(output_text)
+        hypothesis_tokens, hypothesis_ids = tokenize_hypothesis()
     except SAXParseException as e:
         config.logger.log(
             f"            Error: XML parsing failed for output, saved to {output_file_path} : {e}"
         )
-        return 0, False, None, None
+        return None
 
+    with prof_logger.log_time(f"read {txt_path}", "read"):
+        input_text = txt_path.read_text()
+    vocabulary = None if streaming else config.vocabulary
+    reference_ids = None
+    if vocabulary is not None:
+        with prof_logger.log_time(f"intern {xml_path}", "tokenize"):
+            reference_ids = vocabulary.intern(reference_tokens)
     validator_input = MetricInput(
         txt_path,
-        txt_path.read_text(),
+        input_text,
         output_text,
         reference_text,
-        config.tokenizer.tokenize(output_text),
-        config.tokenizer.tokenize(reference_text),
-        profile_logger=config.prof_logger,
+        hypothesis_tokens,
+        reference_tokens,
+        profile_logger=prof_logger,
+        hypothesis_ids=hypothesis_ids,
+        reference_ids=reference_ids,
+        vocabulary=vocabulary,
+        reference_file=xml_path,
+        hypothesis_file=output_file_path,
+        tokenizer=config.tokenizer,
+        artifacts=config.artifacts,
     )
     metric_output = Path(f"{output_file_path}__{metric_engine.name}")
-    if metric_output.exists():
-        shutil.rmtree(metric_output)
-
-    metric_output.mkdir(parents=True, exist_ok=True)
-    with config.prof_logger.log_time(f"{metric_engine.name} for : {txt_path}"):
-        score = metric_engine.calculate(validator_input, metric_output)
-        config.logger.write_file(
-            metric_output.name + "report.yml",
-            yaml.dump(
-                {
-                    "input_file": str(validator_input.input_file.absolute()),
-                    "input_text": validator_input.input_text,
-                    "reference_text": validator_input.reference_text,
-                    "hypothesis_text": validator_input.hypothesis_text,
-                    "hypothesis_tokens": validator_input.hypothesis_tokens,
-                    "reference_tokens": validator_input.reference_tokens,
-                    "score": score,
-                }
-            ),
-        )
+    return Comparison(validator_input, metric_output, output_file_path)
 
-    return score, True, output_file_path, validator_input
+
+def calculate_scores(
+    metric_engine: MetricEngine,
+    comparisons: List[Comparison],
+    configs: List[Config],
+) -> List[Optional[float]]:
+    """Score prepared comparisons, reusing cached scores if there is a score cache.
+
+    Failures are logged and scored None, and are not cached.
+    """
+    for comparison in comparisons:
+        if comparison.metric_output.exists():
+            shutil.rmtree(comparison.metric_output)
+        comparison.metric_output.mkdir(parents=True, exist_ok=True)
+
+    score_cache = configs[0].score_cache if configs else None
+    if score_cache is None:
+        return run_metric(metric_engine, comparisons, configs)
+    tokenizer_id = getattr(configs[0].tokenizer, "identity", configs[0].tokenizer_spec)
+    keys = [
+        ScoreCache.key(metric_engine, comparison.metric_input, tokenizer_id)
+        for comparison in comparisons
+    ]
+    scores = [
+        score_cache.get(key, comparison.metric_output)
+        for key, comparison in zip(keys, comparisons)
+    ]
+    misses = [i for i, score in enumerate(scores) if score is None]
+    computed = run_metric(
+        metric_engine,
+        [comparisons[i] for i in misses],
+        [configs[i] for i in misses],
+    )
+    for i, score in zip(misses, computed):
+        scores[i] = score
+        if score is not None:
+            score_cache.set(keys[i], score, comparisons[i].metric_output)
+    return scores
+
+
+def run_metric(
+    metric_engine: MetricEngine,
+    comparisons: List[Comparison],
+    configs: List[Config],
+) -> List[Optional[float]]:
+    """Score comparisons with `calculate_batch` if the metric has it.
+
+    If the batch fails, the comparisons are scored one at a time, so that
+    only the ones that fail are lost.
+    """
+    if hasattr(metric_engine, "calculate_batch") and comparisons:
+        config = configs[0]
+        try:
+            with config.prof_logger.log_time(
+                f"{metric_engine.name} batch of {len(comparisons)}",
+                "metric",
+                metric_engine.name,
+            ):
+                scores = cast(BatchMetricEngine, metric_engine).calculate_batch(
+                    [
+                        (comparison.metric_input, comparison.metric_output)
+                        for comparison in comparisons
+                    ]
+                )
+            if len(scores) != len(comparisons):
+                raise ValueError(
+                    f"calculate_batch returned {len(scores)} scores "
+                    f"for {len(comparisons)} inputs"
+                )
+            return list(scores)
+        except Exception as e:
+            log_scoring_error(e, config, " in calculate_batch, scoring one at a time")
+
+    scores: List[Optional[float]] = []
+    for comparison, config in zip(comparisons, configs):
+        try:
+            with config.prof_logger.log_time(
+                f"{metric_engine.name} for : {comparison.metric_input.input_file}",
+                "metric",
+                metric_engine.name,
+            ):
+                scores.append(
+                    metric_engine.calculate(
+                        comparison.metric_input, comparison.metric_output
+                    )
+                )
+        except Exception as e:
+            log_scoring_error(e, config)
+            scores.append(None)
+    return scores
 
 
-def do_automarkup(
+def write_report(
+    metric_input: MetricInput,
+    metric_engine: MetricEngine,
+    output_file_path: Path,
+    metric_output: Path,
+    score: float,
+    config: Config,
+) -> None:
+    if config.report_format == "none":
+        return
+    record = {
+        "input_file": str(metric_input.input_file.absolute()),
+        "input_text": metric_input.input_text,
+        "reference_text": metric_input.reference_text,
+        "hypothesis_text": metric_input.hypothesis_text,
+        "hypothesis_tokens": list(metric_input.hypothesis_tokens),
+        "reference_tokens": list(metric_input.reference_tokens),
+        "score": score,
+    }
+    if config.report_format == "yaml":
+        import yaml
+
+        config.logger.write_file(metric_output.name + "report.yml", yaml.dump(record))
+    else:
+        # one file per run: identify the pair that was scored
+        record["metric_engine"] = metric_engine.name
+        record["hypothesis_file"] = str(output_file_path)
+        config.logger.report(record)
+
+
+async def do_automarkup(
     txt_path: Path,
     prompt: str,
     engine_outdir: Path,
     automarkup: MarkupEngine,
+    scheduler: AutomarkupScheduler,
+    source_hash: str,
     config: Config,
 ):
-    with txt_path.open("r") as file:
-        input_text = file.read()
+    with config.prof_logger.log_time(f"read {txt_path}", "read", automarkup.name):
+        with txt_path.open("r") as file:
+            input_text = file.read()
     relative_path = txt_path.relative_to(txt_path.parent.parent)
 
     results_dir = engine_outdir / relative_path.parent / txt_path.stem
     results_dir.mkdir(parents=True, exist_ok=True)
     output_file_path = results_dir / (txt_path.stem + config.operation + ".xml")
-    with config.prof_logger.log_time(f"{automarkup.name} for: {txt_path}"):
+
+    manifest_key = [automarkup.name, str(txt_path)]
+    fingerprint = hash_text(source_hash, prompt, input_text)
+    if config.manifest and output_file_path.exists():
+        data = config.manifest.get("hypothesis", manifest_key, fingerprint)
+        output_text = output_file_path.read_text()
+        if data is not None and data["hypothesis_hash"] == hash_text(output_text):
+            return output_file_path, output_text
+
+    cache = config.automarkup_cache
+    cache_key = AutomarkupCache.key(
+        source_hash, getattr(automarkup, "model", ""), prompt, input_text
+    )
+    output_text = cache.get(cache_key) if cache else None
+    if output_text is None:
         global counter
         counter += 1
-        context = MarkupEngineContext(SimpleLogger(results_dir))
-        output_text = automarkup.automarkup(input_text, prompt, context)
+        output_text = await automarkup_in_chunks(
+            automarkup,
+            input_text,
+            prompt,
+            results_dir,
+            scheduler,
+            config,
+            f"{automarkup.name} for: {txt_path}",
+        )
+        if cache:
+            cache.set(cache_key, output_text)
     with output_file_path.open("w") as output_file:
         output_file.write(output_text)
+    if config.manifest:
+        config.manifest.record(
+            "hypothesis",
+            manifest_key,
+            fingerprint,
+            {"hypothesis_hash": hash_text(output_text)},
+        )
 
     return output_file_path, output_text
 
 
+async def automarkup_in_chunks(
+    automarkup: MarkupEngine,
+    input_text: str,
+    prompt: str,
+    results_dir: Path,
+    scheduler: AutomarkupScheduler,
+    config: Config,
+    span: str = "automarkup",
+) -> str:
+    """Mark up an input, in chunks if it is longer than `config.chunk_tokens`.
+
+    The input is split between blocks, the chunks are marked up concurrently
+    (within the scheduler's limits) and the results merged under one root.
+    """
+    chunks = [input_text]
+    if config.chunk_tokens:
+        overhead = estimate_tokens(automarkup, "", "")
+
+        def count_tokens(text: str) -> int:
+            return estimate_tokens(automarkup, text, "") - overhead
+
+        if count_tokens(input_text) > config.chunk_tokens:
+            chunks = split_text(input_text, config.chunk_tokens, count_tokens)
+    if len(chunks) == 1:
+        logger = SimpleLogger(results_dir)
+        try:
+            return await scheduler.automarkup(
+                automarkup, input_text, prompt, MarkupEngineContext(logger), span
+            )
+        finally:
+            logger.close()
+
+    async def automarkup_chunk(index: int, chunk: str) -> str:
+        chunk_dir = results_dir / f"part{index + 1}"
+        chunk_dir.mkdir(exist_ok=True)
+        logger = SimpleLogger(chunk_dir)
+        try:
+            return await scheduler.automarkup(
+                automarkup,
+                chunk,
+                chunk_prompt(prompt, index, len(chunks)),
+                MarkupEngineContext(logger),
+                f"{span} part {index + 1}",
+            )
+        finally:
+            logger.close()
+
+    outputs = await asyncio.gather(
+        *(automarkup_chunk(index, chunk) for index, chunk in enumerate(chunks))
+    )
+    return merge_documents(outputs)
+
+
+def iter_schema_dirs(config: Config) -> Iterator[Path]:
+    return iter(corpus_index(config).schema_dirs())
+
+
+def iter_input_files(schema_dir: Path, config: Config) -> Iterator[Path]:
+    return iter(corpus_index(config).input_files(schema_dir))
+
+
+def generate_hypotheses(
+    markup_engine: MarkupEngine, config: Config
+) -> Dict[Path, Hypothesis]:
+    """Run the markup engine once over every input file.
+
+    The hypotheses are shared by all of the metric engines, so the
+    (usually slow and expensive) automarkup step is not repeated per metric.
+    Up to `config.max_in_flight` inputs are marked up concurrently.
+    """
+    inputs = [
+        (txt_path, corpus_index(config).prompt(schema_dir))
+        for schema_dir in iter_schema_dirs(config)
+        for txt_path in iter_input_files(schema_dir, config)
+    ]
+    if not inputs:
+        return {}
+
+    engine_outdir = config.outdir / markup_engine.name
+    # identified by its code rather than its output_parameters, so that
+    # a run served from the cache does not have to import the engine
+    source_hash = script_hash(markup_engine.script)
+    if config.chunk_tokens:
+        # chunked output differs from whole-document output
+        source_hash = hash_text(source_hash, f"chunk_tokens={config.chunk_tokens}")
+
+    async def run_all() -> List[Hypothesis]:
+        scheduler = AutomarkupScheduler(
+            config.max_in_flight,
+            config.requests_per_minute,
+            config.tokens_per_minute,
+            config.prof_logger,
+        )
+        return await asyncio.gather(
+            *(
+                generate_hypothesis(
+                    txt_path,
+                    prompt,
+                    engine_outdir,
+                    markup_engine,
+                    scheduler,
+                    source_hash,
+                    config,
+                )
+                for txt_path, prompt in inputs
+            )
+        )
+
+    hypotheses = asyncio.run(run_all())
+    # an engine whose output all came from the cache is not imported just
+    # to record its parameters: they are read from its source instead
+    if not getattr(markup_engine, "loaded", True):
+        cast(LazyEngine, markup_engine).output_source_parameters(engine_outdir)
+    elif hasattr(markup_engine, "output_parameters"):
+        engine_outdir.mkdir(parents=True, exist_ok=True)
+        markup_engine.output_parameters(engine_outdir)
+    return {
+        txt_path: hypothesis for (txt_path, _), hypothesis in zip(inputs, hypotheses)
+    }
+
+
+async def generate_hypothesis(
+    txt_path: Path,
+    prompt: str,
+    engine_outdir: Path,
+    markup_engine: MarkupEngine,
+    scheduler: AutomarkupScheduler,
+    source_hash: str,
+    config: Config,
+) -> Hypothesis:
+    try:
+        output_file_path, output_text = await do_automarkup(
+            txt_path,
+            prompt,
+            engine_outdir,
+            markup_engine,
+            scheduler,
+            source_hash,
+            config,
+        )
+    except (UnicodeDecodeError, SAXParseException, ExpatError, ValueError) as e:
+        return Hypothesis(None, None, e)
+    return Hypothesis(output_file_path, output_text)
+
+
 def process_schema_directory(
     schema_dir: Path,
     automarkup: MarkupEngine,
     metric_engine: MetricEngine,
-    engine_outdir: Path,
+    hypotheses: Dict[Path, Hypothesis],
+    scoring_futures: Dict[Tuple[str, Path], PendingScore],
     config: Config,
-) -> Tuple[float, int, list]:
-    prompt = parse_prompt(schema_dir)
-    score_sum = 0
-    file_count = 0
+) -> Tuple[Dict[str, float], list]:
+    scores: Dict[str, float] = {}
     errors = []
 
     config.logger.log(f"     {schema_dir.stem}")
 
-    filter_list = config.filter_list or ["*.txt"]
-
-    for txt_path in schema_dir.glob("*.txt"):
-        pattern_matches = any(
-            fnmatch(str(txt_path.absolute()), "*/" + f) for f in filter_list
+    for txt_path in iter_input_files(schema_dir, config):
+        score, success, output_file, texts = process_file(
+            txt_path,
+            hypotheses[txt_path],
+            automarkup,
+            metric_engine,
+            scoring_futures,
+            config,
         )
-        if txt_path.stem != "prompt" and pattern_matches:
-            score, success, output_file, metric_input = process_file(
-                txt_path,
-                automarkup,
-                metric_engine,
-                prompt,
-                engine_outdir,
-                config,
+        if success:
+            short_path = txt_path.relative_to(schema_dir.parent)
+            scores[str(short_path)] = score
+            config.logger.log(
+                f"            {short_path} ({output_file}): {score:.2f}{metric_engine.unit}"
             )
-            if success:
-                file_count += 1
-                score_sum += score
-                short_path = txt_path.relative_to(schema_dir.parent)
-                config.logger.log(
-                    f"            {short_path} ({output_file}): {score:.2f}{metric_engine.unit}"
-                )
-                config.logger.log_result(
-                    LogResult(
-                        str(short_path),
-                        automarkup.name,
-                        metric_engine.name,
-                        score,
-                        metric_engine.unit,
-                        metric_input.input_text if metric_input else "",
-                        metric_input.hypothesis_text if metric_input else "",
-                        metric_input.reference_text if metric_input else "",
-                    )
+            config.logger.log_result(
+                LogResult(
+                    str(short_path),
+                    automarkup.name,
+                    metric_engine.name,
+                    score,
+                    metric_engine.unit,
+                    *texts,
                 )
-            else:
-                errors.append([txt_path, output_file])
-
-    return score_sum, file_count, errors
+            )
+        else:
+            errors.append([txt_path, output_file])
+
+    return scores, errors
+
+
+def result_texts(
+    metric_input: Optional[MetricInput], output_file: Optional[Path], config: Config
+) -> Tuple[str, str, str]:
+    """The input, hypothesis and reference columns of a row of `results.csv`.
+
+    Depending on `config.results_texts` these are the texts themselves,
+    their SHA-256 hashes or the paths of the files that contain them.
+    """
+    if metric_input is None:
+        return "", "", ""
+    if config.results_texts == "path":
+        return (
+            str(metric_input.input_file),
+            str(output_file or ""),
+            str(metric_input.reference_file or ""),
+        )
+    texts = (
+        metric_input.input_text,
+        metric_input.hypothesis_text,
+        metric_input.reference_text,
+    )
+    if config.results_texts == "hash":
+        return cast(
+            Tuple[str, str, str],
+            tuple(hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts),
+        )
+    return texts
 
 
 # Protocol for engines
@@ -322,6 +1202,7 @@ class Engine(Protocol):
 class SchemaScore(NamedTuple):
     schema_name: str
     average_score: float
+    scores: Dict[str, float]
 
 
 # NamedTuple for the result of processing a combination
@@ -332,123 +1213,258 @@ class ProcessingResult(NamedTuple):
 
 
 def process_automarkup_metric_combination(
-    markup_engine: MarkupEngine, metric_engine: MetricEngine, config: Config
+    markup_engine: MarkupEngine,
+    metric_engine: MetricEngine,
+    hypotheses: Dict[Path, Hypothesis],
+    scoring_futures: Dict[Tuple[str, Path], PendingScore],
+    config: Config,
 ) -> ProcessingResult:
-    engine_outdir = config.outdir / markup_engine.name
-    if hasattr(markup_engine, "output_parameters"):
-        engine_outdir.mkdir(parents=True, exist_ok=True)
-        markup_engine.output_parameters(engine_outdir)
-
     schema_scores = []
     errors = []
 
-    for schema_dir in config.datadir.rglob("*"):
-        if schema_dir.is_dir():
-            schema_name = schema_dir.stem
+    for schema_dir in iter_schema_dirs(config):
+        schema_name = schema_dir.stem
 
-            score_sum, file_count, schema_errors = process_schema_directory(
-                schema_dir,
-                markup_engine,
-                metric_engine,
-                engine_outdir,
-                config,
-            )
-            errors.extend(schema_errors)
+        scores, schema_errors = process_schema_directory(
+            schema_dir,
+            markup_engine,
+            metric_engine,
+            hypotheses,
+            scoring_futures,
+            config,
+        )
+        errors.extend(schema_errors)
 
-            if file_count > 0:
-                average_score = score_sum / file_count
-                schema_scores.append(SchemaScore(schema_name, average_score))
+        if scores:
+            average_score = sum(scores.values()) / len(scores)
+            schema_scores.append(SchemaScore(schema_name, average_score, scores))
 
     return ProcessingResult(markup_engine.name, metric_engine.name, schema_scores)
 
 
-def generate_results(config: Config):
-    markup_engines = [
-        load_engine(automarkup_engine_script, "AutoMarkup")
-        for automarkup_engine_script in config.automarkup_engine_scripts
-    ]
-    markup_engines = [
-        markup_engine for markup_engine in markup_engines if markup_engine is not None
-    ]
-    markup_engines = cast(List[MarkupEngine], markup_engines)
+def write_csv(config: Config, name: str, header: List[str], rows: List[list]):
+    contents = io.StringIO()
+    writer = csv.writer(contents)
+    writer.writerow(header)
+    writer.writerows(rows)
+    config.logger.write_file(name, contents.getvalue())
 
-    metric_engines = [
-        load_engine(metric_engine_script, "MetricEngine")
-        for metric_engine_script in config.metric_engine_scripts
-    ]
-    metric_engines = [
-        metric_engine for metric_engine in metric_engines if metric_engine is not None
-    ]
-    metric_engines = cast(List[MetricEngine], metric_engines)
 
-    table_data = []
+def format_score(score: Optional[float], unit: str) -> str:
+    return "" if score is None else f"{score:.2f}{unit}"
 
-    for markup_engine in markup_engines:
-        for metric_engine in metric_engines:
-            config.logger.log(
-                f"Processing {markup_engine.name} with {metric_engine.name}"
+
+def log_summaries(results: List[Tuple[ProcessingResult, str]], config: Config):
+    """Log the statistics of each schema's scores, and write `summary.csv`."""
+    # numpy is only imported once there are results, to keep startup fast
+    from markup_metrics.aggregate import summarize_schemas
+
+    table = PrettyTable()
+    table.field_names = [
+        "Markup Engine",
+        "Metric Engine",
+        "Schema Name",
+        "Files",
+        "Average Score",
+        "Median",
+        "Std Dev",
+        "95% CI",
+    ]
+    rows = []
+    for result, unit in results:
+        summaries = summarize_schemas(
+            {
+                schema_score.schema_name: list(schema_score.scores.values())
+                for schema_score in result.schema_scores
+            },
+            config.bootstrap_resamples,
+        )
+        for schema_name, summary in summaries.items():
+            table.add_row(
+                [
+                    result.markup_engine_name,
+                    result.metric_engine_name,
+                    schema_name or "Overall Average",
+                    summary.count,
+                    format_score(summary.mean, unit),
+                    format_score(summary.median, unit),
+                    format_score(summary.stddev, unit),
+                    f"[{summary.ci_low:.2f}, {summary.ci_high:.2f}]{unit}",
+                ]
             )
+            rows.append(
+                [
+                    result.markup_engine_name,
+                    result.metric_engine_name,
+                    schema_name or "Overall Average",
+                    *summary,
+                    unit,
+                ]
+            )
+    if rows:
+        config.logger.log(str(table))
+        write_csv(
+            config,
+            "summary.csv",
+            [
+                "Markup Engine",
+                "Metric Engine",
+                "Schema Name",
+                "Files",
+                "Mean",
+                "Median",
+                "Std Dev",
+                "CI Low",
+                "CI High",
+                "Unit",
+            ],
+            rows,
+        )
+
 
-            result = process_automarkup_metric_combination(
-                markup_engine,
-                metric_engine,
-                config,
+def log_engine_comparisons(results: List[Tuple[ProcessingResult, str]], config: Config):
+    """Compare the markup engines pairwise on the files both scored.
+
+    Logged and written to `comparisons.csv` per metric and schema, and
+    over all schemas, when there are at least two markup engines.
+    """
+    if config.bootstrap_resamples <= 0:
+        return
+    from markup_metrics.aggregate import compare_engines
+
+    # metric -> schema (None for all of them) -> markup engine -> file -> score
+    by_metric: Dict[str, Dict[Optional[str], Dict[str, Dict[str, float]]]] = {}
+    units: Dict[str, str] = {}
+    for result, unit in results:
+        units[result.metric_engine_name] = unit
+        by_schema = by_metric.setdefault(result.metric_engine_name, {None: {}})
+        for schema_score in result.schema_scores:
+            by_schema.setdefault(schema_score.schema_name, {})[
+                result.markup_engine_name
+            ] = schema_score.scores
+            by_schema[None].setdefault(result.markup_engine_name, {}).update(
+                schema_score.scores
             )
 
-            for schema_score in result.schema_scores:
-                table_data.append(
-                    {
-                        "Markup Engine": result.markup_engine_name,
-                        "Metric Engine": result.metric_engine_name,
-                        "Schema Name": schema_score.schema_name,
-                        "Average Score": f"{schema_score.average_score:.2f}{metric_engine.unit}",
-                    }
+    table = PrettyTable()
+    table.field_names = [
+        "Metric Engine",
+        "Schema Name",
+        "Engine A",
+        "Engine B",
+        "Files",
+        "Mean A - B",
+        "95% CI",
+        "p-value",
+    ]
+    rows = []
+    for metric_name, by_schema in by_metric.items():
+        unit = units[metric_name]
+        # the schemas in order, then all of them
+        for schema_name in [*list(by_schema)[1:], None]:
+            for comparison in compare_engines(
+                by_schema[schema_name], config.bootstrap_resamples
+            ):
+                schema_label = schema_name or "Overall"
+                table.add_row(
+                    [
+                        metric_name,
+                        schema_label,
+                        comparison.engine_a,
+                        comparison.engine_b,
+                        comparison.count,
+                        f"{comparison.mean_difference:.2f}{unit}",
+                        f"[{comparison.ci_low:.2f}, {comparison.ci_high:.2f}]{unit}",
+                        f"{comparison.p_value:.4f}",
+                    ]
                 )
+                rows.append([metric_name, schema_label, *comparison])
+    if rows:
+        config.logger.log(str(table))
+        write_csv(
+            config,
+            "comparisons.csv",
+            [
+                "Metric Engine",
+                "Schema Name",
+                "Engine A",
+                "Engine B",
+                "Files",
+                "Mean Difference",
+                "CI Low",
+                "CI High",
+                "p-value",
+            ],
+            rows,
+        )
 
-            if result.schema_scores:
-                overall_average = statistics.mean(
-                    score.average_score for score in result.schema_scores
-                )
-                table_data.append(
-                    {
-                        "Markup Engine": result.markup_engine_name,
-                        "Metric Engine": result.metric_engine_name,
-                        "Schema Name": "Overall Average",
-                        "Average Score": f"{overall_average:.2f}{metric_engine.unit}",
-                    }
-                )
 
-    # Output the data in table format
-    if table_data:
-        table = PrettyTable()
-        table.field_names = [
-            "Markup Engine",
-            "Metric Engine",
-            "Schema Name",
-            "Average Score",
-        ]
-        for row in table_data:
-            table.add_row(
-                [
-                    row["Markup Engine"],
-                    row["Metric Engine"],
-                    row["Schema Name"],
-                    row["Average Score"],
-                ]
+def available_engines(engines: List[Any]) -> List[Any]:
+    available = []
+    for engine in engines:
+        try:
+            engine.load()
+        except EngineUnavailable:
+            continue
+        available.append(engine)
+    return available
+
+
+def generate_results(config: Config):
+    # engines are only imported when first used: an automarkup engine when
+    # it has input to mark up, the metrics when there is something to score
+    markup_engines = [
+        cast(MarkupEngine, LazyEngine(automarkup_engine_script, "AutoMarkup"))
+        for automarkup_engine_script in config.automarkup_engine_scripts
+    ]
+    metric_engines = [
+        cast(MetricEngine, LazyEngine(metric_engine_script, "MetricEngine"))
+        for metric_engine_script in config.metric_engine_scripts
+    ]
+
+    results: List[Tuple[ProcessingResult, str]] = []
+
+    with make_scoring_executor(config, metric_engines) as executor:
+        for markup_engine in markup_engines:
+            try:
+                hypotheses = generate_hypotheses(markup_engine, config)
+            except EngineUnavailable:
+                continue
+            if hypotheses:
+                metric_engines = available_engines(metric_engines)
+            scoring_futures = submit_scoring_units(
+                markup_engine, metric_engines, hypotheses, executor, config
             )
-        config.logger.log(str(table))
 
-    timing = "Context\tTime (s)\tCalls\n"
-    for log in config.prof_logger.times:
-        timing += f"{log.name}\t{log.time:.6f}\n"
-    config.logger.write_file("timing.tsv", timing)
+            for metric_engine in metric_engines:
+                config.logger.log(
+                    f"Processing {markup_engine.name} with {metric_engine.name}"
+                )
 
-    with open(config.outdir / "results.csv", "w") as results_file:
-        csv_writer = csv.DictWriter(
-            results_file, config.logger._results[0]._asdict().keys()
+                result = process_automarkup_metric_combination(
+                    markup_engine,
+                    metric_engine,
+                    hypotheses,
+                    scoring_futures,
+                    config,
+                )
+                results.append((result, metric_engine.unit))
+
+    with config.prof_logger.log_time("aggregate"):
+        log_summaries(results, config)
+        log_engine_comparisons(results, config)
+
+    timing = "Context\tTime (s)\tCalls\tMean (s)\tP50 (s)\tP95 (s)\tMax (s)\n"
+    for stats in config.prof_logger.stats():
+        context = f"{stats.stage} {stats.engine}" if stats.engine else stats.stage
+        timing += (
+            f"{context}\t{stats.total:.6f}\t{stats.calls}\t{stats.mean:.6f}"
+            f"\t{stats.p50:.6f}\t{stats.p95:.6f}\t{stats.max:.6f}\n"
         )
-        csv_writer.writeheader()
-        csv_writer.writerows(r._asdict() for r in config.logger._results)
+    config.logger.write_file("timing.tsv", timing)
+    config.logger.write_file(
+        "trace.json", json.dumps(config.prof_logger.chrome_trace())
+    )
 
 
 class CharacterTokenizer(TokenizerProtocol):
@@ -456,6 +1472,18 @@ class CharacterTokenizer(TokenizerProtocol):
         return list(text)
 
 
+def make_tokenizer(tokenizer_spec: str) -> TokenizerProtocol:
+    if tokenizer_spec == "xml" or not tokenizer_spec:
+        return XMLTokenizer()
+    elif tokenizer_spec == "expat":
+        return ExpatTokenizer()
+    elif tokenizer_spec == "char":
+        return CharacterTokenizer()
+    else:
+        tokenizer_engine = load_engine(tokenizer_spec, "Tokenizer")
+        return cast(TokenizerProtocol, tokenizer_engine)
+
+
 class ArgumentParseError(Exception):
     pass
 
@@ -484,14 +1512,20 @@ def parse_args() -> Config:
     parser.add_argument(
         "--outdir", type=Path, default="./out", help="Path to the output directory."
     )
-    parser.add_argument(
+    existing_output = parser.add_mutually_exclusive_group()
+    existing_output.add_argument(
         "--replace", action="store_true", help="Replace existing output."
     )
+    existing_output.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep existing output and only redo work whose inputs changed.",
+    )
     parser.add_argument(
         "--tokenizer",
         type=str,
         default="xml",
-        help="Use a custom tokenizer or 'xml' or 'char'.",
+        help="Use a custom tokenizer or 'xml', 'expat' (faster, same tokens) or 'char'.",
     )
     parser.add_argument("--filter-file", type=str, help="Filter file.")
     parser.add_argument("--halt-on-error", action="store_true", help="Halt on error.")
@@ -505,17 +1539,116 @@ def parse_args() -> Config:
         action="store_true",
         help="Save the output of the markup engines as test cases.",
     )
+    parser.add_argument(
+        "--results-texts",
+        choices=["inline", "hash", "path"],
+        default="inline",
+        help="Store the texts in results.csv, their SHA-256 hashes or their paths.",
+    )
+    parser.add_argument(
+        "--report-format",
+        choices=["jsonl", "yaml", "none"],
+        default="jsonl",
+        help="Write per-pair reports to reports.jsonl, to report.yml files, or not at all.",
+    )
+    parser.add_argument(
+        "--prune-references",
+        action="store_true",
+        help="Score inputs with several references from the most promising down, "
+        "skipping those that cannot beat the best score so far (for metrics with "
+        "score_upper_bound).",
+    )
+    parser.add_argument(
+        "--artifacts",
+        choices=ARTIFACT_LEVELS,
+        default="full",
+        help="What metrics write besides their scores: nothing, a summary, or "
+        "everything (such as xater's token lists and diff).",
+    )
+    parser.add_argument(
+        "--bootstrap-resamples",
+        type=int,
+        default=2000,
+        help="Resamples for the confidence intervals and engine comparisons.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used for scoring.",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1,
+        help="Number of automarkup requests to run concurrently.",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        help="Mark up inputs longer than this many tokens in chunks of at most "
+        "this many, concurrently, and merge the results.",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        help="Limit on automarkup requests started per minute.",
+    )
+    parser.add_argument(
+        "--tokens-per-minute",
+        type=float,
+        help="Limit on estimated automarkup prompt tokens sent per minute.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for caches that persist between runs.",
+    )
+    parser.add_argument(
+        "--no-automarkup-cache",
+        action="store_true",
+        help="Always call the markup engines instead of reusing cached output.",
+    )
+    parser.add_argument(
+        "--clear-automarkup-cache",
+        action="store_true",
+        help="Empty the automarkup cache before running.",
+    )
+    parser.add_argument(
+        "--automarkup-cache-size",
+        type=int,
+        default=1024,
+        help="Size limit of the automarkup cache in megabytes.",
+    )
+    parser.add_argument(
+        "--token-cache",
+        action="store_true",
+        help="Keep tokenized documents in --cache-dir between runs.",
+    )
+    parser.add_argument(
+        "--corpus-index-cache",
+        action="store_true",
+        help="Keep the listing of --datadir in --cache-dir between runs.",
+    )
+    parser.add_argument(
+        "--score-cache",
+        action="store_true",
+        help="Keep metric scores in --cache-dir between runs, and reuse them for "
+        "unchanged metrics, hypotheses and references.",
+    )
+    parser.add_argument(
+        "--clear-score-cache",
+        action="store_true",
+        help="Empty the score cache before running.",
+    )
 
     args = parser.parse_args()
     setup_catalog_env_var()
 
-    if args.tokenizer == "xml" or not args.tokenizer:
-        tokenizer: TokenizerProtocol = XMLTokenizer()
-    elif args.tokenizer == "char":
-        tokenizer = CharacterTokenizer()
-    else:
-        tokenizer_engine = load_engine(args.tokenizer, "Tokenizer")
-        tokenizer = cast(TokenizerProtocol, tokenizer_engine)
+    token_cache_dir = args.cache_dir / "tokens" if args.token_cache else None
+    tokenizer = CachingTokenizer(make_tokenizer(args.tokenizer), token_cache_dir)
 
     datadir = Path(args.datadir)
     outdir = Path(args.outdir)
@@ -538,7 +1671,7 @@ def parse_args() -> Config:
     else:
         filter_list = None
 
-    if outdir.exists():
+    if outdir.exists() and not args.resume:
         print(
             f"Out directory already exists: {outdir}"
             + (" Replacing." if args.replace else "")
@@ -550,8 +1683,34 @@ def parse_args() -> Config:
                 "Out directory already exists, use --replace to replace."
             )
 
-    outdir.mkdir(parents=True)
-    logger = SimpleLogger(outdir)
+    outdir.mkdir(parents=True, exist_ok=args.resume)
+    logger = SimpleLogger(outdir, results=True)
+
+    automarkup_cache = None
+    if args.clear_automarkup_cache or not args.no_automarkup_cache:
+        automarkup_cache = AutomarkupCache(
+            args.cache_dir / "automarkup", args.automarkup_cache_size * 1024 * 1024
+        )
+        if args.clear_automarkup_cache:
+            automarkup_cache.clear()
+        if args.no_automarkup_cache:
+            automarkup_cache.close()
+            automarkup_cache = None
+
+    previous_reports = None
+    if args.resume:
+        # carried over into this run's reports as their pairs are resumed
+        previous_reports = read_reports(outdir / "reports.jsonl")
+        (outdir / "reports.jsonl").unlink(missing_ok=True)
+
+    score_cache = None
+    if args.score_cache or args.clear_score_cache:
+        score_cache = ScoreCache(args.cache_dir / "scores")
+        if args.clear_score_cache:
+            score_cache.clear()
+        if not args.score_cache:
+            score_cache.close()
+            score_cache = None
 
     config = Config(
         automarkup_engine_scripts,
@@ -565,6 +1724,30 @@ def parse_args() -> Config:
         args.operation or "",
         args.halt_on_error,
         args.save_as_test_cases,
+        args.jobs,
+        args.tokenizer,
+        args.max_in_flight,
+        args.requests_per_minute,
+        args.tokens_per_minute,
+        automarkup_cache,
+        token_cache_dir,
+        Vocabulary(),
+        RunManifest(outdir, args.resume),
+        args.results_texts,
+        args.report_format,
+        args.bootstrap_resamples,
+        args.chunk_tokens,
+        CorpusIndex(
+            datadir,
+            filter_list,
+            args.cache_dir / "corpus" / f"{hash_text(str(datadir.resolve()))}.json"
+            if args.corpus_index_cache
+            else None,
+        ),
+        score_cache,
+        args.artifacts,
+        args.prune_references,
+        previous_reports,
     )
     return config
 
@@ -0,0 +1,110 @@
+import ast
+import functools
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from markup_metrics.automarkup_cache import hash_text
+from markup_metrics.utils import sibling_module
+
+
+def _sibling_imports(path: Path) -> Iterator[Path]:
+    """The modules in the same directory as `path` that it imports, as
+    `sibling`, `package.sibling` (the directory being `package`) or `.sibling`.
+    """
+    directory = path.parent
+    tree = ast.parse(path.read_text(encoding="utf-8"), str(path))
+    names: List[str] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = "." * node.level + (node.module or "")
+            names.append(base)
+            # `from package import module` imports a module too
+            names.extend(f"{base}.{alias.name}".lstrip(".") for alias in node.names)
+    for name in names:
+        candidate = sibling_module(directory, name)
+        if candidate is not None:
+            yield candidate
+
+
+@functools.lru_cache(maxsize=None)
+def script_hash(script: str) -> str:
+    """Hash an engine script with the sibling modules it imports, recursively.
+
+    A metric whose logic lives in sibling modules, as xater's does in ter.py
+    and diff.py, is then identified by their code too.
+    """
+    seen = {Path(script).resolve()}
+    pending = list(seen)
+    while pending:
+        for imported in _sibling_imports(pending.pop()):
+            imported = imported.resolve()
+            if imported not in seen:
+                seen.add(imported)
+                pending.append(imported)
+    return hash_text(
+        *(
+            part
+            for path in sorted(seen)
+            for part in (path.name, path.read_text(encoding="utf-8"))
+        )
+    )
+
+
+class RunManifest:
+    """Records each completed unit of work of a run, so that it can be resumed.
+
+    Entries are stored one JSON object per line in `manifest.jsonl` and are
+    flushed as soon as they are recorded, so a crashed run loses at most the
+    unit it was working on. An entry is only reused if it was recorded with
+    the same fingerprint: a hash of everything the unit's result depends on.
+    """
+
+    def __init__(self, outdir: Path, resume: bool) -> None:
+        self.path = outdir / "manifest.jsonl"
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if resume and self.path.exists():
+            with self.path.open("r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line of a crashed run may be incomplete
+                        continue
+                    self._entries[entry["key"]] = entry
+        # rewrite the manifest without superseded or incomplete entries
+        compacted = self.path.with_name(self.path.name + ".tmp")
+        with compacted.open("w", encoding="utf-8") as file:
+            for entry in self._entries.values():
+                file.write(json.dumps(entry) + "\n")
+        compacted.replace(self.path)
+        self._file = self.path.open("a", encoding="utf-8")
+
+    @staticmethod
+    def _key(kind: str, parts: Sequence[str]) -> str:
+        return json.dumps([kind, *parts])
+
+    def get(
+        self, kind: str, parts: Sequence[str], fingerprint: str
+    ) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(self._key(kind, parts))
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["data"]
+
+    def record(
+        self, kind: str, parts: Sequence[str], fingerprint: str, data: Dict[str, Any]
+    ) -> None:
+        key = self._key(kind, parts)
+        entry = {"key": key, "fingerprint": fingerprint, "data": data}
+        self._entries[key] = entry
+        self._write(entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
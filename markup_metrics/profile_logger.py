@@ -1,11 +1,55 @@
+import asyncio
 import contextlib
+import contextvars
+import math
+import os
+import threading
 import time
-from typing import Generator, List, NamedTuple
+from typing import Any, Dict, Generator, List, NamedTuple, Optional, Tuple
 
 
 class ProfileLog(NamedTuple):
     name: str
     time: float
+    stage: str = ""
+    engine: str = ""
+    # perf_counter() at the start of the span: a system-wide monotonic clock,
+    # so that spans from worker processes can be put on the same timeline
+    start: float = 0.0
+    depth: int = 0
+    pid: int = 0
+    tid: int = 0
+
+
+class StageStats(NamedTuple):
+    stage: str
+    engine: str
+    calls: int
+    total: float
+    mean: float
+    p50: float
+    p95: float
+    max: float
+
+
+# (stage, engine, depth) of the innermost open span of the current thread or task
+_current_span: contextvars.ContextVar[
+    Optional[Tuple[str, str, int]]
+] = contextvars.ContextVar("current_span", default=None)
+
+
+def _thread_or_task_id() -> int:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    # concurrent tasks interleave on one thread, give each its own track
+    return id(task) if task is not None else threading.get_ident()
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of a sorted, non-empty list."""
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
 
 
 class ProfileLogger:
@@ -13,8 +57,78 @@ class ProfileLogger:
         self.times: List[ProfileLog] = []
 
     @contextlib.contextmanager
-    def log_time(self, context: str) -> Generator[None, None, None]:
+    def log_time(
+        self, context: str, stage: Optional[str] = None, engine: Optional[str] = None
+    ) -> Generator[None, None, None]:
+        """Time a span, nested in any span that is open around it.
+
+        Spans are aggregated by `stage`, which defaults to `context`, and by
+        `engine`, which defaults to the engine of the enclosing span.
+        """
+        parent = _current_span.get()
+        if engine is None:
+            engine = parent[1] if parent else ""
+        stage = context if stage is None else stage
+        depth = parent[2] + 1 if parent else 0
+        token = _current_span.set((stage, engine, depth))
         start = time.perf_counter()
-        yield
-        end = time.perf_counter()
-        self.times.append(ProfileLog(context, end - start))
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _current_span.reset(token)
+            self.times.append(
+                ProfileLog(
+                    context,
+                    end - start,
+                    stage,
+                    engine,
+                    start,
+                    depth,
+                    os.getpid(),
+                    _thread_or_task_id(),
+                )
+            )
+
+    def stats(self) -> List[StageStats]:
+        """Statistics per stage and engine, in order of first completion."""
+        groups: Dict[Tuple[str, str], List[float]] = {}
+        for log in self.times:
+            groups.setdefault((log.stage, log.engine), []).append(log.time)
+        stats = []
+        for (stage, engine), times in groups.items():
+            ordered = sorted(times)
+            total = sum(ordered)
+            stats.append(
+                StageStats(
+                    stage,
+                    engine,
+                    len(ordered),
+                    total,
+                    total / len(ordered),
+                    _percentile(ordered, 50),
+                    _percentile(ordered, 95),
+                    ordered[-1],
+                )
+            )
+        return stats
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans as Chrome / Perfetto trace events."""
+        origin = min((log.start for log in self.times), default=0.0)
+        return {
+            "traceEvents": [
+                {
+                    "name": log.name,
+                    "cat": log.stage,
+                    "ph": "X",
+                    "ts": (log.start - origin) * 1e6,
+                    "dur": log.time * 1e6,
+                    "pid": log.pid,
+                    "tid": log.tid,
+                    "args": {"engine": log.engine, "depth": log.depth},
+                }
+                for log in self.times
+            ],
+            "displayTimeUnit": "ms",
+        }
@@ -0,0 +1,121 @@
+import asyncio
+import contextlib
+import time
+from typing import Any, Callable, ContextManager, Optional
+
+from markup_engines.types import Context as MarkupEngineContext
+from markup_metrics.profile_logger import ProfileLogger
+
+
+def estimate_tokens(engine: Any, input_text: str, prompt: str) -> int:
+    if hasattr(engine, "count_tokens"):
+        return engine.count_tokens(input_text, prompt)
+    # roughly four characters per token for English text
+    return (len(input_text) + len(prompt)) // 4 + 1
+
+
+async def automarkup_async(
+    engine: Any, input_text: str, prompt: str, context: MarkupEngineContext
+) -> str:
+    """Call an engine's async interface, or run a sync engine in a thread."""
+    if hasattr(engine, "automarkup_async"):
+        return await engine.automarkup_async(input_text, prompt, context)
+    return await asyncio.to_thread(engine.automarkup, input_text, prompt, context)
+
+
+class RateLimiter:
+    """A token bucket which refills at `per_minute` units per minute."""
+
+    def __init__(
+        self,
+        per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # a single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self.available = min(
+                    self.capacity, self.available + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await self.sleep((amount - self.available) / self.rate)
+
+
+class AutomarkupScheduler:
+    """Keeps up to `max_in_flight` automarkup requests running at once,
+    within optional requests-per-minute and tokens-per-minute budgets.
+
+    With a `prof_logger`, each engine call is timed as an "automarkup" span
+    and the wait for a slot and the rate limits as an "automarkup wait" span.
+
+    Must be created inside the event loop that uses it.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 1,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        prof_logger: Optional[ProfileLogger] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ) -> None:
+        self._semaphore = asyncio.Semaphore(max(1, max_in_flight))
+        self._request_limiter = (
+            RateLimiter(requests_per_minute, clock, sleep)
+            if requests_per_minute
+            else None
+        )
+        self._token_limiter = (
+            RateLimiter(tokens_per_minute, clock, sleep) if tokens_per_minute else None
+        )
+        self._prof_logger = prof_logger
+
+    def _log_time(
+        self, context: str, stage: str, engine: Optional[str]
+    ) -> ContextManager[None]:
+        if self._prof_logger is None:
+            return contextlib.nullcontext()
+        return self._prof_logger.log_time(context, stage, engine)
+
+    async def automarkup(
+        self,
+        engine: Any,
+        input_text: str,
+        prompt: str,
+        context: MarkupEngineContext,
+        span: str = "automarkup",
+    ) -> str:
+        engine_name = getattr(engine, "name", None)
+        with self._log_time(f"wait for {span}", "automarkup wait", engine_name):
+            await self._semaphore.acquire()
+            try:
+                if self._request_limiter:
+                    await self._request_limiter.acquire(1)
+                if self._token_limiter:
+                    await self._token_limiter.acquire(
+                        estimate_tokens(engine, input_text, prompt)
+                    )
+            except BaseException:
+                self._semaphore.release()
+                raise
+        try:
+            with self._log_time(span, "automarkup", engine_name):
+                return await automarkup_async(engine, input_text, prompt, context)
+        finally:
+            self._semaphore.release()
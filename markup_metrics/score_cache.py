@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import diskcache
+
+from markup_metrics.automarkup_cache import hash_text
+from markup_metrics.manifest import script_hash
+from metric_engines.types import MetricEngine, MetricInput
+
+
+class CachedScore(NamedTuple):
+    score: float
+    # the files the metric wrote to its output directory, by relative path
+    artifacts: Dict[str, bytes]
+
+
+class ScoreCache:
+    """An on-disk cache of metric scores and the files written with them.
+
+    A score is keyed by the source of the metric script and of the sibling
+    modules it imports, the tokenizer's identity, the artifact level and the
+    texts the metric is given: input, hypothesis and reference. A metric that
+    depends on anything else, such as DTDs found through the XML catalog, may
+    be served a stale score when that changes; clear the cache then.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self._cache = diskcache.Cache(str(directory))
+
+    @staticmethod
+    def key(
+        metric_engine: MetricEngine, metric_input: MetricInput, tokenizer_id: str
+    ) -> str:
+        return hash_text(
+            script_hash(metric_engine.script),
+            tokenizer_id,
+            metric_input.artifacts,
+            hash_text(metric_input.input_text),
+            hash_text(metric_input.hypothesis_text),
+            hash_text(metric_input.reference_text),
+        )
+
+    def get(self, key: str, output_dir: Path) -> Optional[float]:
+        """The cached score, after restoring its files into `output_dir`."""
+        cached: Optional[CachedScore] = self._cache.get(key)
+        if cached is None:
+            return None
+        for name, contents in cached.artifacts.items():
+            path = output_dir / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(contents)
+        return cached.score
+
+    def set(self, key: str, score: float, output_dir: Path) -> None:
+        artifacts = {
+            str(path.relative_to(output_dir)): path.read_bytes()
+            for path in sorted(output_dir.rglob("*"))
+            if path.is_file()
+        }
+        self._cache.set(key, CachedScore(score, artifacts))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def close(self) -> None:
+        self._cache.close()
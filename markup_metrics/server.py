@@ -0,0 +1,297 @@
+import argparse
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import socketserver
+import traceback
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+import uuid
+from xml.sax import SAXParseException
+
+from markup_engines.types import Tokenizer as TokenizerProtocol
+from markup_metrics.automarkup_cache import DEFAULT_CACHE_DIR
+from markup_metrics.main import make_tokenizer
+from markup_metrics.profile_logger import ProfileLogger
+from markup_metrics.token_cache import CachingTokenizer
+from markup_metrics.utils import load_engine, setup_catalog_env_var
+from metric_engines.types import ARTIFACT_LEVELS, MetricEngine, MetricInput
+
+
+class ScoreRequest(NamedTuple):
+    text: str
+    hypothesis: str
+    reference: str
+    # names the directory the request's files are written to
+    schema: str = "default"
+    # names of the metrics to run, all of them if None
+    metrics: Optional[List[str]] = None
+    artifacts: str = "full"
+
+
+class RequestError(ValueError):
+    pass
+
+
+def parse_request(body: Any) -> ScoreRequest:
+    if not isinstance(body, dict):
+        raise RequestError("Expected a JSON object")
+    for field in ("text", "hypothesis", "reference"):
+        if not isinstance(body.get(field), str):
+            raise RequestError(f"Missing or non-string field: {field}")
+    unknown = set(body) - set(ScoreRequest._fields)
+    if unknown:
+        raise RequestError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    request = ScoreRequest(**body)
+    schema = request.schema
+    if (
+        not isinstance(schema, str)
+        or Path(schema).name != schema
+        or schema.startswith(".")
+    ):
+        raise RequestError(f"Not a schema name: {schema!r}")
+    if request.metrics is not None and not isinstance(request.metrics, list):
+        raise RequestError("metrics must be a list of metric names")
+    if request.artifacts not in ARTIFACT_LEVELS:
+        raise RequestError(f"artifacts must be one of {', '.join(ARTIFACT_LEVELS)}")
+    return request
+
+
+class ScoringService:
+    """Metric engines and a tokenizer, loaded once and shared by every request.
+
+    Requests can be scored from several threads at once: each one writes its
+    texts and the metrics' files to a directory of its own, and the
+    tokenizer's cache is locked. Loaded engines keep their own caches, such
+    as the validation metric's compiled DTDs, between requests.
+    """
+
+    def __init__(
+        self,
+        metric_engines: List[MetricEngine],
+        tokenizer: TokenizerProtocol,
+        outdir: Path,
+    ) -> None:
+        self.metric_engines = {engine.name: engine for engine in metric_engines}
+        self.tokenizer = tokenizer
+        self.outdir = outdir
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "metrics": {
+                name: {"unit": engine.unit}
+                for name, engine in self.metric_engines.items()
+            }
+        }
+
+    def score(self, request: ScoreRequest) -> Dict[str, Any]:
+        """Score the hypothesis against the reference with each requested metric.
+
+        Raises RequestError for unknown metrics or a reference that does not
+        parse. A hypothesis that does not parse fails every metric, with a
+        score of 0, as it does in a run of markup-metrics.py.
+        """
+        names = request.metrics or list(self.metric_engines)
+        unknown = [name for name in names if name not in self.metric_engines]
+        if unknown:
+            raise RequestError(f"Unknown metrics: {', '.join(map(str, unknown))}")
+        try:
+            reference_tokens = self.tokenizer.tokenize(request.reference)
+        except SAXParseException as e:
+            raise RequestError(f"XML parsing failed for the reference: {e}") from e
+
+        directory = self.outdir / request.schema / uuid.uuid4().hex
+        directory.mkdir(parents=True)
+        input_file = directory / "input.txt"
+        input_file.write_text(request.text)
+        hypothesis_file = directory / "hypothesis.xml"
+        hypothesis_file.write_text(request.hypothesis)
+        reference_file = directory / "reference.xml"
+        reference_file.write_text(request.reference)
+
+        error = None
+        hypothesis_tokens: List[str] = []
+        try:
+            hypothesis_tokens = self.tokenizer.tokenize(request.hypothesis)
+        except SAXParseException as e:
+            error = f"XML parsing failed for the hypothesis: {e}"
+
+        scores: Dict[str, Dict[str, Any]] = {}
+        for name in names:
+            engine = self.metric_engines[name]
+            if error is not None:
+                scores[name] = {"score": 0, "success": False, "error": error}
+                continue
+            # streaming metrics read the files written above
+            streaming = getattr(engine, "streams_tokens", False)
+            metric_input = MetricInput(
+                input_file,
+                request.text,
+                request.hypothesis,
+                request.reference,
+                [] if streaming else hypothesis_tokens,
+                [] if streaming else reference_tokens,
+                profile_logger=ProfileLogger(),
+                reference_file=reference_file,
+                hypothesis_file=hypothesis_file,
+                tokenizer=self.tokenizer,
+                artifacts=request.artifacts,
+            )
+            metric_output = Path(f"{hypothesis_file}__{name}")
+            metric_output.mkdir()
+            try:
+                score = engine.calculate(metric_input, metric_output)
+            except Exception as e:
+                traceback.print_exc()
+                scores[name] = {"score": 0, "success": False, "error": str(e)}
+                continue
+            scores[name] = {
+                "score": score,
+                "unit": engine.unit,
+                "success": True,
+                "artifacts": str(metric_output),
+            }
+        return {"directory": str(directory), "scores": scores}
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """`GET /metrics` lists the metrics; `POST /score` scores a ScoreRequest."""
+
+    server: Union["ScoringHTTPServer", "ScoringUnixServer"]
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self._reply(200, self.server.service.describe())
+        else:
+            self._reply(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path != "/score":
+            self._reply(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            result = self.server.service.score(parse_request(body))
+        except (RequestError, json.JSONDecodeError) as e:
+            self._reply(400, {"error": str(e)})
+        except (TypeError, ValueError) as e:
+            # a missing Content-Length, or metric names that are not strings
+            self._reply(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            traceback.print_exc()
+            self._reply(500, {"error": str(e)})
+        else:
+            self._reply(200, result)
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "local"
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    service: ScoringService
+
+
+class ScoringUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    service: ScoringService
+
+
+def make_server(
+    service: ScoringService,
+    host: str,
+    port: int,
+    socket_path: Optional[Path] = None,
+) -> Union[ScoringHTTPServer, ScoringUnixServer]:
+    server: Union[ScoringHTTPServer, ScoringUnixServer]
+    if socket_path is not None:
+        if socket_path.is_socket():
+            # left behind by a server that did not shut down cleanly
+            socket_path.unlink()
+        server = ScoringUnixServer(str(socket_path), ScoringHandler)
+    else:
+        server = ScoringHTTPServer((host, port), ScoringHandler)
+    server.service = service
+    return server
+
+
+def main():
+    pkg_root = str(Path(__file__).parent.parent)
+    parser = argparse.ArgumentParser(
+        description="Serve metric scores over HTTP, on a local port or Unix socket."
+    )
+    parser.add_argument(
+        "--metric-engines",
+        type=str,
+        default=f"{pkg_root}/metric_engines/*_metric.py",
+        help="Glob pattern for the scripts containing the MetricEngine classes.",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        default="xml",
+        help="Use a custom tokenizer or 'xml', 'expat' (faster, same tokens) or 'char'.",
+    )
+    parser.add_argument(
+        "--outdir",
+        type=Path,
+        default="./out/server",
+        help="Directory for the texts and metric files of each request.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--socket", type=Path, help="Listen on this Unix socket instead of a port."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for caches that persist between runs.",
+    )
+    parser.add_argument(
+        "--token-cache",
+        action="store_true",
+        help="Keep tokenized documents in --cache-dir between runs.",
+    )
+    args = parser.parse_args()
+    setup_catalog_env_var()
+
+    metric_engines = []
+    for script in sorted(glob(args.metric_engines)):
+        engine = load_engine(script, "MetricEngine")
+        if engine is not None:
+            metric_engines.append(engine)
+    if not metric_engines:
+        print(f"No metric engines found: {args.metric_engines}")
+        return 1
+    tokenizer = CachingTokenizer(
+        make_tokenizer(args.tokenizer),
+        args.cache_dir / "tokens" if args.token_cache else None,
+    )
+    service = ScoringService(metric_engines, tokenizer, args.outdir)
+    server = make_server(service, args.host, args.port, args.socket)
+    address = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"Scoring with {', '.join(service.metric_engines)} on {address}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None:
+            args.socket.unlink(missing_ok=True)
+        tokenizer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
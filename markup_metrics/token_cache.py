@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from pathlib import Path
+import sys
+import threading
+from typing import IO, Iterator, List, Optional, Union
+
+import diskcache
+
+from markup_engines.types import Tokenizer as TokenizerProtocol
+from markup_metrics.automarkup_cache import hash_text
+from markup_metrics.tokenize_xml import iter_tokens
+
+
+def tokenizer_identity(tokenizer: TokenizerProtocol) -> str:
+    """Identify a tokenizer by its class and the source code that defines it."""
+    cls = type(tokenizer)
+    script = getattr(tokenizer, "script", None) or getattr(
+        sys.modules.get(cls.__module__), "__file__", None
+    )
+    source = Path(script).read_text(encoding="utf-8") if script else ""
+    return hash_text(cls.__module__, cls.__qualname__, source)
+
+
+class CachingTokenizer(TokenizerProtocol):
+    """Memoizes another tokenizer by tokenizer identity and content hash.
+
+    Every document is tokenized once per run, however many metrics and
+    markup engines look at it. Token lists are shared between callers and
+    must not be modified. If `directory` is given, successful tokenizations
+    are also kept on disk between runs.
+    """
+
+    def __init__(
+        self,
+        tokenizer: TokenizerProtocol,
+        directory: Optional[Path] = None,
+        max_entries: int = 1024,
+    ) -> None:
+        self.tokenizer = tokenizer
+        self.identity = tokenizer_identity(tokenizer)
+        self.max_entries = max_entries
+        self._memory: OrderedDict[str, Union[List[str], Exception]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = diskcache.Cache(str(directory)) if directory else None
+
+    def tokenize(self, xml_string: str) -> List[str]:
+        key = hash_text(self.identity, xml_string)
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+        if result is None and self._disk is not None:
+            result = self._disk.get(key)
+        if result is None:
+            try:
+                result = self.tokenizer.tokenize(xml_string)
+            except Exception as e:
+                # parse failures are only remembered for this run
+                result = e
+            else:
+                if self._disk is not None:
+                    self._disk.set(key, result)
+        with self._lock:
+            self._memory[key] = result
+            if len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def iter_tokens(self, stream: IO[str]) -> Iterator[str]:
+        # streamed documents are not cached, that would defeat the point
+        return iter_tokens(self.tokenizer, stream)
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
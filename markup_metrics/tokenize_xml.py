@@ -1,4 +1,7 @@
+from typing import IO, AnyStr, Iterable, Iterator, List, cast
+from xml.parsers import expat
 import xml.sax
+import xml.sax.xmlreader
 from markup_engines.types import Tokenizer as TokenizerProtocol
 
 
@@ -6,6 +9,8 @@ class TokenizingSaxHandler(xml.sax.ContentHandler):
     def __init__(self):
         self.tokens = []
         self.chars = []
+        # tokens already taken out of self.tokens when streaming
+        self.emitted = 0
 
     def startElement(self, name, attrs):
         self.flush_chars()
@@ -13,7 +18,7 @@ class TokenizingSaxHandler(xml.sax.ContentHandler):
         # Sort attributes by key
         for attr_name, attr_value in sorted(attrs.items()):
             if attr_name == "id":
-                attr_value = f"ID {len(self.tokens)}"
+                attr_value = f"ID {self.emitted + len(self.tokens)}"
             self.tokens.append(f'{attr_name}="{attr_value}" ')
         self.tokens.append(">")
 
@@ -42,6 +47,136 @@ class XMLTokenizer(TokenizerProtocol):
         xml.sax.parseString(xml_string, handler)
         return handler.tokens
 
+    def iter_tokens(self, stream: IO[str]) -> Iterator[str]:
+        handler = TokenizingSaxHandler()
+        parser = cast(xml.sax.xmlreader.IncrementalParser, xml.sax.make_parser())
+        parser.setContentHandler(handler)
+        # the buffer size of parseString, so that text is chunked the same way
+        for chunk in _read_chunks(stream, 2**16 - 20):
+            parser.feed(chunk)
+            yield from handler.tokens
+            handler.emitted += len(handler.tokens)
+            handler.tokens = []
+        if not handler.emitted:
+            # closing a parser that was never fed does not check anything
+            parser.feed("")
+        parser.close()
+        yield from handler.tokens
+
+
+class _ExpatLocator(xml.sax.xmlreader.Locator):
+    def __init__(self, parser) -> None:
+        self.parser = parser
+
+    def getColumnNumber(self):
+        return self.parser.ErrorColumnNumber
+
+    def getLineNumber(self):
+        return self.parser.ErrorLineNumber
+
+
+class ExpatTokenizer(TokenizerProtocol):
+    """Produces exactly the tokens of XMLTokenizer, driving pyexpat directly.
+
+    The parser is set up and fed like the one behind `xml.sax.parseString`,
+    so that character data arrives in the same chunks, which matters because
+    chunks are joined with spaces. Parse errors are raised as the same
+    SAXParseException.
+    """
+
+    # the default buffer size of xml.sax.expatreader.ExpatParser
+    chunk_size = 2**16 - 20
+
+    def tokenize(self, xml_string):
+        chunks = (
+            xml_string[start : start + self.chunk_size]
+            for start in range(0, len(xml_string), self.chunk_size)
+        )
+        batches = self._token_batches(chunks)
+        tokens = next(batches)
+        for batch in batches:
+            tokens.extend(batch)
+        return tokens
+
+    def iter_tokens(self, stream: IO[str]) -> Iterator[str]:
+        for batch in self._token_batches(_read_chunks(stream, self.chunk_size)):
+            yield from batch
+
+    def _token_batches(self, chunks: Iterable[AnyStr]) -> Iterator[List[str]]:
+        """Parse `chunks` and yield the tokens completed by each of them."""
+        tokens: List[str] = []
+        append = tokens.append
+        chars: List[str] = []
+        emitted = 0
+
+        def flush_chars():
+            text = " ".join(" ".join(chars).split())
+            if text:
+                append(text)
+            chars.clear()
+
+        def start_element(name, attrs):
+            if chars:
+                flush_chars()
+            append(f"<{name} ")
+            if attrs:
+                for attr_name in sorted(attrs):
+                    if attr_name == "id":
+                        append(f'id="ID {emitted + len(tokens)}" ')
+                    else:
+                        append(f'{attr_name}="{attrs[attr_name]}" ')
+            append(">")
+
+        def end_element(name):
+            if chars:
+                flush_chars()
+            append(f"</{name}>")
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = chars.append
+        parser.ExternalEntityRefHandler = lambda *args: 1
+        parser.SkippedEntityHandler = lambda name, is_pe: None
+        parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_UNLESS_STANDALONE)
+        try:
+            for chunk in chunks:
+                parser.Parse(chunk, False)
+                if tokens:
+                    emitted += len(tokens)
+                    yield tokens
+                    # the handlers append to whatever list `tokens` is now
+                    tokens = []
+                    append = tokens.append
+            parser.Parse(b"", True)
+        except expat.ExpatError as e:
+            raise xml.sax.SAXParseException(
+                expat.ErrorString(e.code), e, _ExpatLocator(parser)
+            ) from None
+        yield tokens
+
+
+def _read_chunks(stream: IO[str], size: int) -> Iterator[str]:
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        if not isinstance(chunk, str):
+            # chunks of bytes could split a character that a parse of the
+            # decoded document would keep in one text token
+            raise TypeError("Tokenizing a stream needs a text stream")
+        yield chunk
+
+
+def iter_tokens(tokenizer: TokenizerProtocol, stream: IO[str]) -> Iterator[str]:
+    """Tokenize a text stream, incrementally if the tokenizer can.
+
+    The tokens are those `tokenize` gives for the stream's whole text.
+    """
+    if hasattr(tokenizer, "iter_tokens"):
+        return tokenizer.iter_tokens(stream)  # type: ignore
+    return iter(tokenizer.tokenize(stream.read()))
+
 
 if __name__ == "__main__":
     # Test XML
@@ -1,7 +1,8 @@
+import ast
 import importlib.util
 import os
 from pathlib import Path
-from typing import Optional, Type
+from typing import Any, Dict, NamedTuple, Optional, Set, Type
 
 
 def load_class(script: str, class_name: str):
@@ -16,6 +17,7 @@ def load_engine(engine_script: str, class_name: str) -> Optional[Type]:
     engine_class = load_class(engine_script, class_name)
     engine_name = Path(engine_script).stem
     engine_class.name = engine_name
+    engine_class.script = engine_script
     try:
         engine_instance = engine_class()
     except AssertionError as e:
@@ -25,6 +27,207 @@ def load_engine(engine_script: str, class_name: str) -> Optional[Type]:
     return engine_instance
 
 
+class EngineUnavailable(Exception):
+    pass
+
+
+class ClassMetadata(NamedTuple):
+    # class attributes assigned literal values, such as a metric's `unit`
+    attributes: Dict[str, Any]
+    # every name the class body or its methods define
+    names: Set[str]
+    # whether `names` is known to be every attribute an instance can have
+    complete: bool
+
+
+def sibling_module(directory: Path, name: str) -> Optional[Path]:
+    """The file of module `name` if it is in `directory`, imported as
+    `sibling`, `package.sibling` (the directory being `package`) or `.sibling`.
+    """
+    parts = name.lstrip(".").split(".")
+    if len(parts) == 2 and parts[0] == directory.name:
+        parts = parts[1:]
+    candidate = directory / f"{parts[0]}.py"
+    if len(parts) == 1 and candidate.is_file():
+        return candidate
+    return None
+
+
+def _base_class_metadata(
+    base: ast.expr, tree: ast.Module, script: str
+) -> Optional[ClassMetadata]:
+    """The metadata of a base class defined in `script` or a sibling module,
+    or None if where it is defined cannot be told from the source."""
+    directory = Path(script).parent
+    if isinstance(base, ast.Name):
+        if any(
+            isinstance(node, ast.ClassDef) and node.name == base.id
+            for node in tree.body
+        ):
+            return read_class_metadata(script, base.id)
+        # from sibling import Class
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    if (alias.asname or alias.name) == base.id:
+                        module = "." * node.level + (node.module or "")
+                        path = sibling_module(directory, module)
+                        if path is not None:
+                            return read_class_metadata(str(path), alias.name)
+    elif isinstance(base, ast.Attribute) and isinstance(base.value, ast.Name):
+        # sibling.Class, with `import sibling` or `from package import sibling`
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    if (alias.asname or alias.name) != base.value.id:
+                        continue
+                    module = alias.name
+                    if isinstance(node, ast.ImportFrom):
+                        module = "." * node.level + f"{node.module or ''}.{module}"
+                    path = sibling_module(directory, module)
+                    if path is not None:
+                        return read_class_metadata(str(path), base.attr)
+    return None
+
+
+def read_class_metadata(script: str, class_name: str) -> ClassMetadata:
+    """Read what can be known about a class without running its script.
+
+    Base classes defined in the script or in sibling modules are read too.
+    """
+    tree = ast.parse(Path(script).read_text(encoding="utf-8"), script)
+    class_def = next(
+        (
+            node
+            for node in tree.body
+            if isinstance(node, ast.ClassDef) and node.name == class_name
+        ),
+        None,
+    )
+    if class_def is None:
+        return ClassMetadata({}, set(), False)
+
+    bases = [_base_class_metadata(base, tree, script) for base in class_def.bases]
+    attributes: Dict[str, Any] = {}
+    names: Set[str] = set()
+    # the first base's attributes win, as in a method resolution order
+    for base_metadata in reversed(bases):
+        if base_metadata is not None:
+            attributes.update(base_metadata.attributes)
+            names |= base_metadata.names
+    for node in class_def.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if not isinstance(target, ast.Name):
+                    continue
+                names.add(target.id)
+                try:
+                    attributes[target.id] = ast.literal_eval(node.value)  # type: ignore
+                except ValueError:
+                    # not a literal, and it overrides any base's value
+                    attributes.pop(target.id, None)
+    for node in ast.walk(class_def):
+        if (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.ctx, ast.Store)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == "self"
+        ):
+            names.add(node.attr)
+            # set per instance, so the class attribute may not be the value
+            attributes.pop(node.attr, None)
+    # anything else in the script that sets attributes on the class
+    patched = any(
+        isinstance(node, ast.Attribute)
+        and isinstance(node.ctx, ast.Store)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == class_name
+        for node in ast.walk(tree)
+    )
+    if patched or class_def.decorator_list:
+        return ClassMetadata({}, names, False)
+    complete = not (
+        any(base is None or not base.complete for base in bases)
+        or class_def.keywords
+        or names & {"__getattr__", "__getattribute__"}
+    )
+    return ClassMetadata(attributes, names, complete)
+
+
+class LazyEngine:
+    """An engine whose script is only run, and class instantiated, on first use.
+
+    `name` and `script` are known up front. Literal class attributes (like a
+    metric's `unit`) and whether the class has a method (`hasattr`) are read
+    from the script's source, so checking them does not import the engine.
+    An engine that cannot be instantiated is reported once and raises
+    EngineUnavailable whenever it is used.
+    """
+
+    def __init__(self, engine_script: str, class_name: str) -> None:
+        self.script = engine_script
+        self.name = Path(engine_script).stem
+        self.class_name = class_name
+        self._metadata: Optional[ClassMetadata] = None
+        self._instance: Any = None
+        self._error: Optional[str] = None
+
+    def load(self) -> Any:
+        if self._instance is None:
+            if self._error is not None:
+                raise EngineUnavailable(self._error)
+            try:
+                self._instance = load_engine(self.script, self.class_name)
+            except ImportError as e:
+                print(f"Cannot import {self.class_name.lower()} engine: ", e)
+                print(f"Skipping {self.class_name.lower()} engine: ", self.name)
+            if self._instance is None:
+                self._error = f"{self.class_name} engine {self.name} is unavailable"
+                raise EngineUnavailable(self._error)
+        return self._instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, attribute: str) -> Any:
+        # only called for attributes this proxy doesn't have itself
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        if self._instance is None:
+            if self._metadata is None:
+                self._metadata = read_class_metadata(self.script, self.class_name)
+            if attribute in self._metadata.attributes:
+                return self._metadata.attributes[attribute]
+            if self._metadata.complete and attribute not in self._metadata.names:
+                raise AttributeError(attribute)
+        return getattr(self.load(), attribute)
+
+    def output_source_parameters(self, outdir: Path) -> None:
+        """Record the engine's parameters as far as its source tells, without
+        running it: the script as code.txt and each literal string class
+        attribute (such as a prompt `message` or a `model`) as <name>.txt.
+        Engines without an `output_parameters` method record nothing.
+        """
+        if self._metadata is None:
+            self._metadata = read_class_metadata(self.script, self.class_name)
+        if "output_parameters" not in self._metadata.names:
+            return
+        outdir.mkdir(parents=True, exist_ok=True)
+        (outdir / "code.txt").write_text(
+            Path(self.script).read_text(encoding="utf-8"), encoding="utf-8"
+        )
+        for attribute, value in self._metadata.attributes.items():
+            if isinstance(value, str) and not attribute.startswith("_"):
+                (outdir / f"{attribute}.txt").write_text(value, encoding="utf-8")
+
+    def __repr__(self) -> str:
+        return f"<LazyEngine {self.name}>"
+
+
 def setup_catalog_env_var():
     if os.environ.get("XML_CATALOG_FILES"):
         print("XML_CATALOG_FILES set, ignoring and overriding it.")
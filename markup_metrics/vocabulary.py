@@ -0,0 +1,46 @@
+from array import array
+import threading
+from typing import Dict, Iterable, List, Sequence
+
+
+class Vocabulary:
+    """Maps tokens to integer ids, shared by every document in a run.
+
+    Ids are assigned in order of first appearance, so they are only
+    comparable for equality, not for ordering; use `lookup` to order them.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def intern(self, tokens: Iterable[str]) -> array:
+        ids = self._ids
+        result = array("i")
+        with self._lock:
+            for token in tokens:
+                token_id = ids.get(token)
+                if token_id is None:
+                    token_id = ids[token] = len(self._tokens)
+                    self._tokens.append(token)
+                result.append(token_id)
+        return result
+
+    def lookup(self, token_id: int) -> str:
+        return self._tokens[token_id]
+
+    def tokens(self, token_ids: Sequence[int]) -> List[str]:
+        return [self._tokens[token_id] for token_id in token_ids]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
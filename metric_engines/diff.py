@@ -0,0 +1,239 @@
+"""A linear-space Myers diff of token sequences, formatted like difflib.
+
+`difflib.SequenceMatcher` looks for the longest matching block and
+recurses on both sides of it, which is quadratic on long repetitive
+sequences such as the token streams of DITA tasks. Myers' algorithm takes
+O((N + M) D) time for D differences and, finding the middle snake of the
+edit path from both ends, O(N + M) space.
+"""
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def _middle_snake(
+    a: Sequence, alo: int, ahi: int, b: Sequence, blo: int, bhi: int
+) -> Optional[Tuple[int, int]]:
+    """A point on a shortest edit path from (alo, blo) to (ahi, bhi).
+
+    The path is searched forwards from the start and backwards from the
+    end at once, until the two searches overlap. Returns None if the
+    sequences have nothing in common.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    length = 2 * max_d + 2
+    # the furthest x reached on each diagonal k = x - y, forwards and
+    # backwards (counting from the ends of the sequences), or -1
+    forward = [-1] * length
+    backward = [-1] * length
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    # if the difference of the lengths is odd, the forward search reaches
+    # the overlap first
+    front = delta % 2 != 0
+    # diagonals that left the grid are not searched again
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (
+                k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]
+            ):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and backward[k2_offset] != -1:
+                    if x1 >= n - backward[k2_offset]:
+                        return alo + x1, blo + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (
+                k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]
+            ):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = x1 - (k1_offset - offset)
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+    return None
+
+
+def _snakes(a: Sequence, b: Sequence) -> Iterator[Tuple[int, int, int]]:
+    """The matching blocks of a shortest edit script, in order, maybe adjacent."""
+    # ranges still to compare, and matching blocks found before them that
+    # come after them in order, as (i, j, size)
+    stack: List[Tuple[int, ...]] = [(0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            yield item  # type: ignore
+            continue
+        alo, ahi, blo, bhi = item
+        prefix = 0
+        while alo + prefix < ahi and blo + prefix < bhi:
+            if a[alo + prefix] != b[blo + prefix]:
+                break
+            prefix += 1
+        if prefix:
+            yield alo, blo, prefix
+            alo += prefix
+            blo += prefix
+        suffix = 0
+        while ahi - suffix > alo and bhi - suffix > blo:
+            if a[ahi - suffix - 1] != b[bhi - suffix - 1]:
+                break
+            suffix += 1
+        if suffix:
+            ahi -= suffix
+            bhi -= suffix
+            stack.append((ahi, bhi, suffix))
+        if alo == ahi or blo == bhi:
+            continue
+        split = _middle_snake(a, alo, ahi, b, blo, bhi)
+        if split is None or split in ((alo, blo), (ahi, bhi)):
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+
+def matching_blocks(a: Sequence, b: Sequence) -> List[Tuple[int, int, int]]:
+    """Like `SequenceMatcher(None, a, b).get_matching_blocks()`, but minimal.
+
+    The blocks are those of a shortest edit script: (i, j, size) triples
+    with a[i:i + size] == b[j:j + size], in order, ending with (len(a),
+    len(b), 0). Items must be hashable.
+    """
+    # items that only one side has are never matched: diff the others, as
+    # ints which compare faster, and map the blocks back
+    ids: Dict[Hashable, int] = {}
+    a_ids = [ids.setdefault(item, len(ids)) for item in a]
+    b_ids = [ids.get(item, -1) for item in b]
+    shared = set(b_ids)
+    a_kept = [i for i, token_id in enumerate(a_ids) if token_id in shared]
+    b_kept = [j for j, token_id in enumerate(b_ids) if token_id != -1]
+
+    blocks: List[Tuple[int, int, int]] = []
+    for i, j, size in _snakes([a_ids[i] for i in a_kept], [b_ids[j] for j in b_kept]):
+        for k in range(size):
+            ai, bj = a_kept[i + k], b_kept[j + k]
+            last = blocks[-1] if blocks else None
+            if last and last[0] + last[2] == ai and last[1] + last[2] == bj:
+                blocks[-1] = (last[0], last[1], last[2] + 1)
+            else:
+                blocks.append((ai, bj, 1))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def opcodes(a: Sequence, b: Sequence) -> List[Opcode]:
+    """Like `SequenceMatcher(None, a, b).get_opcodes()`."""
+    codes: List[Opcode] = []
+    i = j = 0
+    for ai, bj, size in matching_blocks(a, b):
+        tag = ""
+        if i < ai and j < bj:
+            tag = "replace"
+        elif i < ai:
+            tag = "delete"
+        elif j < bj:
+            tag = "insert"
+        if tag:
+            codes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            codes.append(("equal", ai, i, bj, j))
+    return codes
+
+
+def grouped_opcodes(codes: List[Opcode], n: int = 3) -> Iterator[List[Opcode]]:
+    """Like `SequenceMatcher.get_grouped_opcodes`: hunks with n items of context."""
+    if not codes:
+        codes = [("equal", 0, 1, 0, 1)]
+    codes = list(codes)
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        # split a long run of equal items into the end of one hunk and the
+        # start of the next
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    if not length:
+        start -= 1
+    return f"{start + 1},{length}"
+
+
+def unified_diff(
+    a: Sequence[str],
+    b: Sequence[str],
+    fromfile: str = "",
+    tofile: str = "",
+    n: int = 3,
+) -> Iterator[str]:
+    """The lines of a unified diff from a to b, without line terminators."""
+    started = False
+    for group in grouped_opcodes(opcodes(a, b), n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}"
+            yield f"+++ {tofile}"
+        first, last = group[0], group[-1]
+        yield (
+            f"@@ -{_format_range(first[1], last[2])} "
+            f"+{_format_range(first[3], last[4])} @@"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            for line in a[i1:i2]:
+                yield "-" + line
+            for line in b[j1:j2]:
+                yield "+" + line
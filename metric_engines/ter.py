@@ -0,0 +1,153 @@
+"""Translation Edit Rate, computing exactly the same scores as `pyter.ter`.
+
+pyter fills a full Levenshtein matrix in Python for every candidate shift
+that it tries. This implementation follows the same greedy shift search,
+and breaks ties between equally good shifts the same way, but:
+
+* edit distances use the bit-parallel algorithm of Myers / Hyyrö, which
+  processes one hypothesis token per step with the reference as a bit
+  vector, and resume from the state after the prefix that a shifted
+  hypothesis shares with the unshifted one;
+* candidate shifts are found through an index of reference positions by
+  token instead of comparing every pair of positions;
+* a candidate is skipped without computing its distance when moving its
+  phrase cannot possibly beat the best shift found so far.
+"""
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+_State = Tuple[int, int, int]
+
+
+class BitParallelEditDistance:
+    """Levenshtein distance of token sequences to a fixed reference."""
+
+    def __init__(self, reference: Sequence[Hashable]) -> None:
+        self.length = len(reference)
+        self.mask = (1 << self.length) - 1
+        self.last = 1 << (self.length - 1) if self.length else 0
+        peq: Dict[Hashable, int] = defaultdict(int)
+        for j, token in enumerate(reference):
+            peq[token] |= 1 << j
+        self.peq = dict(peq)
+
+    def initial(self) -> _State:
+        # (vertical positive deltas, vertical negative deltas, distance)
+        return (self.mask, 0, self.length)
+
+    def advance(self, state: _State, tokens: Sequence[Hashable]) -> _State:
+        vp, vn, score = state
+        mask, last, peq = self.mask, self.last, self.peq
+        for token in tokens:
+            eq = peq.get(token, 0)
+            xv = eq | vn
+            xh = (((eq & vp) + vp) ^ vp) | eq
+            hp = vn | (~(xh | vp) & mask)
+            hn = vp & xh
+            if hp & last:
+                score += 1
+            elif hn & last:
+                score -= 1
+            hp = ((hp << 1) | 1) & mask
+            hn = (hn << 1) & mask
+            vp = hn | (~(xv | hp) & mask)
+            vn = hp & xv
+        return (vp, vn, score)
+
+    def prefix_states(self, tokens: Sequence[Hashable]) -> List[_State]:
+        states = [self.initial()]
+        for token in tokens:
+            states.append(self.advance(states[-1], (token,)))
+        return states
+
+    def __call__(self, tokens: Sequence[Hashable]) -> int:
+        if not self.length:
+            return len(tokens)
+        return self.advance(self.initial(), tokens)[2]
+
+
+def ter(
+    hypothesis: Sequence[Hashable],
+    reference: Sequence[Hashable],
+    order: Optional[Callable[[Any], Any]] = None,
+) -> float:
+    """Translation Edit Rate of `hypothesis` against `reference`.
+
+    Same result as `pyter.ter(hypothesis, reference)`. Tokens are only
+    compared for equality, except to break ties between shifts, where they
+    are ordered by `order` if given: e.g. the vocabulary lookup for integer
+    token ids, so that they rank the same as the token strings would.
+    """
+    hypothesis, reference = list(hypothesis), list(reference)
+    edit_distance = BitParallelEditDistance(reference)
+    positions: Dict[Hashable, List[int]] = defaultdict(list)
+    for j, token in enumerate(reference):
+        positions[token].append(j)
+
+    shifts = 0
+    while True:
+        shifted = _best_shift(hypothesis, reference, positions, edit_distance, order)
+        if shifted is None:
+            break
+        shifts += 1
+        hypothesis = shifted
+    return (shifts + edit_distance(hypothesis)) / len(reference)
+
+
+def _best_shift(
+    hypothesis: List[Hashable],
+    reference: List[Hashable],
+    positions: Dict[Hashable, List[int]],
+    edit_distance: BitParallelEditDistance,
+    order: Optional[Callable[[Any], Any]] = None,
+) -> Optional[List[Hashable]]:
+    """The shifted hypothesis which most reduces the edit distance.
+
+    Like pyter, ties go to the lexicographically greatest shifted hypothesis,
+    and None is returned when no shift reduces the distance.
+    """
+    if not edit_distance.length:
+        return None
+    states = edit_distance.prefix_states(hypothesis)
+    pre_score = states[-1][2]
+    best_delta = 1
+    best: Optional[List[Hashable]] = None
+    hyp_len, ref_len = len(hypothesis), len(reference)
+
+    for isp, token in enumerate(hypothesis):
+        for rsp in positions.get(token, ()):
+            if isp == rsp:
+                continue
+            length = 1
+            while (
+                isp + length < hyp_len
+                and rsp + length < ref_len
+                and hypothesis[isp + length] == reference[rsp + length]
+            ):
+                length += 1
+            # moving `length` tokens costs at most `length` deletions and
+            # `length` insertions, so it cannot save more than that
+            if min(2 * length, pre_score) < best_delta:
+                continue
+
+            shifted = hypothesis[:isp] + hypothesis[isp + length :]
+            shifted[rsp:rsp] = hypothesis[isp : isp + length]
+            common = min(isp, rsp)
+            score = edit_distance.advance(states[common], shifted[common:])[2]
+            delta = pre_score - score
+            if delta > best_delta or (
+                delta == best_delta and (best is None or _greater(shifted, best, order))
+            ):
+                best_delta, best = delta, shifted
+    return best
+
+
+def _greater(
+    left: List[Hashable], right: List[Hashable], order: Optional[Callable]
+) -> bool:
+    if order is None:
+        return left > right  # type: ignore
+    for x, y in zip(left, right):
+        if x != y:
+            return order(x) > order(y)
+    return len(left) > len(right)
@@ -1,9 +1,26 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, NamedTuple, Protocol, Sequence
+from typing import (
+    TYPE_CHECKING,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
 from pathlib import Path
 
+from markup_metrics.tokenize_xml import iter_tokens
+
 if TYPE_CHECKING:
+    from markup_engines.types import Tokenizer
     from markup_metrics.main import ProfileLogger
+    from markup_metrics.vocabulary import Vocabulary
+
+# how much a metric writes to its output directory besides the score: nothing,
+# a few lines about the comparison, or everything that helps to explain it
+ARTIFACT_LEVELS = ("none", "summary", "full")
 
 
 class MetricEngine(Protocol):
@@ -14,6 +31,42 @@ class MetricEngine(Protocol):
         ...
 
 
+class StreamingMetricEngine(MetricEngine, Protocol):
+    """A metric which reads its tokens with `MetricInput.iter_*_tokens`.
+
+    It is given empty token lists, so that a document's tokens are never all
+    in memory at once if the tokenizer can stream.
+    """
+
+    streams_tokens: bool
+
+
+class BatchMetricEngine(MetricEngine, Protocol):
+    """A metric which can score many inputs at once more cheaply than one by one.
+
+    `calculate_batch` returns one score per (input, output_file_dir) pair, in
+    order. The runner falls back to `calculate` for each pair if it raises.
+    """
+
+    def calculate_batch(
+        self, inputs: Sequence[Tuple[MetricInput, Path]]
+    ) -> List[float]:
+        ...
+
+
+class BoundedMetricEngine(MetricEngine, Protocol):
+    """A metric which can cheaply bound its score of an input from above.
+
+    With --prune-references, the runner scores a hypothesis against its
+    references from the highest bound down, and skips those whose bound is
+    below the best score so far. The bound must never be less than the
+    score that `calculate` would return.
+    """
+
+    def score_upper_bound(self, input: MetricInput) -> float:
+        ...
+
+
 class MetricInput(NamedTuple):
     input_file: Path
     input_text: str
@@ -22,6 +75,31 @@ class MetricInput(NamedTuple):
     hypothesis_tokens: Sequence[str]
     reference_tokens: Sequence[str]
     profile_logger: ProfileLogger
+    # the same tokens as ids in a run-wide vocabulary (array("i"))
+    hypothesis_ids: Optional[Sequence[int]] = None
+    reference_ids: Optional[Sequence[int]] = None
+    vocabulary: Optional[Vocabulary] = None
+    reference_file: Optional[Path] = None
+    hypothesis_file: Optional[Path] = None
+    tokenizer: Optional[Tokenizer] = None
+    # one of ARTIFACT_LEVELS
+    artifacts: str = "full"
+
+    def iter_hypothesis_tokens(self) -> Iterator[str]:
+        return self._iter_tokens(self.hypothesis_tokens, self.hypothesis_file)
+
+    def iter_reference_tokens(self) -> Iterator[str]:
+        return self._iter_tokens(self.reference_tokens, self.reference_file)
+
+    def _iter_tokens(
+        self, tokens: Sequence[str], path: Optional[Path]
+    ) -> Iterator[str]:
+        # the token lists are left empty for metrics that stream
+        if tokens or path is None or self.tokenizer is None:
+            yield from tokens
+            return
+        with path.open("r") as stream:
+            yield from iter_tokens(self.tokenizer, stream)
 
 
 class MetricOutput(NamedTuple):
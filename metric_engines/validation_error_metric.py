@@ -1,7 +1,9 @@
 from pathlib import Path
+import re
+import threading
 from lxml import etree
 from io import BytesIO, StringIO
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
 from metric_engines.types import MetricInput
 
@@ -28,7 +30,7 @@ class MetricEngine:
         
         # If there are well-formedness errors, the perfect score is 0.5
 
-        if num_wf_errors > 0:
+        if num_wf_errors > 0 and input.artifacts != "none":
             errors = list(map(str, well_formed_parser.error_log))
             output_file_path = output_file_dir / "well_formedness_errors.txt"
             
@@ -39,15 +41,17 @@ class MetricEngine:
 
         # Perform DTD validation only if DTD is present
         if has_dtd:
-            dtd_parser = etree.XMLParser(dtd_validation=True, load_dtd=True, recover=True, resolve_entities=True)
-            etree.parse(BytesIO(hypothesis_xml.encode()), dtd_parser)
+            dtd_errors = validate_with_cached_dtd(hypothesis_xml, well_formed_tree, num_wf_errors)
+            if dtd_errors is None:
+                dtd_parser = etree.XMLParser(dtd_validation=True, load_dtd=True, recover=True, resolve_entities=True)
+                etree.parse(BytesIO(hypothesis_xml.encode()), dtd_parser)
+                dtd_errors = list(map(str, dtd_parser.error_log))
             # Get the number of DTD errors
-            num_dtd_errors = len(dtd_parser.error_log)
+            num_dtd_errors = len(dtd_errors)
 
-            if num_dtd_errors > 0:
-                errors = list(map(str, dtd_parser.error_log))
+            if num_dtd_errors > 0 and input.artifacts != "none":
                 output_file_path = output_file_dir / "dtd_errors.txt"
-                output_file_path.write_text("\n".join(["DTD errors: "] + errors ))
+                output_file_path.write_text("\n".join(["DTD errors: "] + dtd_errors ))
         else:
             num_dtd_errors = 0
 
@@ -61,5 +65,73 @@ class MetricEngine:
         validation_error_rate = good_tags_ratio * 100
         return validation_error_rate
     
+
+DTDKey = Tuple[Optional[str], Optional[str]]
+
+# Compiled external DTDs by (public id, system url), with the errors
+# reported while loading them. A DTD keeps the error log of its last
+# validation, so each is used by one thread at a time: a thread takes one
+# from the pool, or loads another if they are all in use, and puts it
+# back once it has validated. The lock is not held while validating.
+_dtd_pools: Dict[DTDKey, List[Tuple[etree.DTD, List[str]]]] = {}
+# DTDs that could not be loaded
+_unloadable_dtds: Set[DTDKey] = set()
+_dtd_lock = threading.Lock()
+
+_internal_subset = re.compile(r"<!DOCTYPE[^>\[]*\[")
+
+
+def validate_with_cached_dtd(hypothesis_xml: str, tree, num_wf_errors: int) -> Optional[List[str]]:
+    """Validate an already parsed tree against its cached external DTD.
+
+    Returns the same errors as a validating reparse would count, or None
+    when that cannot be guaranteed and the caller should reparse: for
+    malformed documents (libxml2 stops validating after a fatal error),
+    internal DTD subsets and DTDs that cannot be loaded.
+    """
+    if num_wf_errors > 0 or _internal_subset.search(hypothesis_xml):
+        return None
+    docinfo = tree.docinfo
+    key = (docinfo.public_id, docinfo.system_url)
+    with _dtd_lock:
+        if key in _unloadable_dtds:
+            return None
+        pool = _dtd_pools.setdefault(key, [])
+        cached = pool.pop() if pool else None
+    if cached is None:
+        cached = load_dtd(docinfo.root_name, *key)
+        if cached is None:
+            with _dtd_lock:
+                _unloadable_dtds.add(key)
+            return None
+    dtd, load_errors = cached
+    try:
+        dtd.validate(tree)
+        return load_errors + list(map(str, dtd.error_log))
+    finally:
+        with _dtd_lock:
+            pool.append(cached)
+
+
+def load_dtd(root_name: str, public_id: Optional[str], system_url: Optional[str]) -> Optional[Tuple[etree.DTD, List[str]]]:
+    # Let the parser resolve the DTD through the catalog exactly as it
+    # would for the document itself, by parsing a stub with the same DOCTYPE.
+    if public_id:
+        external_id = f'PUBLIC "{public_id}" "{system_url or ""}"'
+    elif system_url:
+        external_id = f'SYSTEM "{system_url}"'
+    else:
+        return None
+    stub = f"<!DOCTYPE {root_name} {external_id}><{root_name}/>"
+    parser = etree.XMLParser(load_dtd=True, recover=True, resolve_entities=True)
+    try:
+        dtd = etree.parse(BytesIO(stub.encode()), parser).docinfo.externalDTD
+    except (etree.XMLSyntaxError, AssertionError):
+        return None
+    if dtd is None:
+        return None
+    return dtd, list(map(str, parser.error_log))
+
+
 def clamp(number, bottom, top):
     return max(bottom, min(number, top))
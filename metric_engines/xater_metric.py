@@ -1,8 +1,8 @@
+from collections import Counter
 from pathlib import Path
-from typing import List
-import pyter
-import difflib
 
+from metric_engines.diff import unified_diff
+from metric_engines.ter import ter as translation_edit_rate
 from metric_engines.types import MetricInput
 
 
@@ -10,29 +10,67 @@ class MetricEngine:
     unit = "%"
 
     def calculate(self, input: MetricInput, output_file_dir: Path) -> float:
-        with input.profile_logger.log_time("xater.difflib"):
-            diffs = difflib.unified_diff(
-                input.reference_tokens,
-                input.hypothesis_tokens,
-                tofile="reference",
-                fromfile="hypothesis",
-            )
-        (output_file_dir / "hypothesis_tokenized.txt").write_text(
-            "\n".join(input.hypothesis_tokens)
-        )
-        (output_file_dir / "referenced_tokenized.txt").write_text(
-            "\n".join(input.reference_tokens)
-        )
-        cdiff = "\n".join(diffs)
-        output_file_path = output_file_dir / "unified_diff.txt"
-        output_file_path.write_text(cdiff)
-        with input.profile_logger.log_time("xater.pyter"):
-            ter = pyter.ter(input.hypothesis_tokens, input.reference_tokens)
+        with input.profile_logger.log_time("xater.ter"):
+            if input.vocabulary is not None:
+                ter = translation_edit_rate(
+                    input.hypothesis_ids,  # type: ignore
+                    input.reference_ids,  # type: ignore
+                    order=input.vocabulary.lookup,
+                )
+            else:
+                ter = translation_edit_rate(
+                    input.hypothesis_tokens, input.reference_tokens
+                )
             clamped_ter = clamp(ter, 0, 1)
             score = 100 - clamped_ter * 100
 
+        if input.artifacts == "full":
+            write_diff(input, output_file_dir)
+        elif input.artifacts == "summary":
+            (output_file_dir / "summary.txt").write_text(
+                f"hypothesis tokens: {len(input.hypothesis_tokens)}\n"
+                f"reference tokens: {len(input.reference_tokens)}\n"
+                f"TER: {ter:.4f}\n"
+            )
         return score
 
+    def score_upper_bound(self, input: MetricInput) -> float:
+        """The score of the fewest edits that could turn one bag of tokens into
+        the other.
+
+        Shifts only move tokens, and each insertion, deletion or substitution
+        fixes at most one token that one side has more of than the other.
+        """
+        if not input.reference_tokens:
+            return 100
+        hypothesis = Counter(input.hypothesis_tokens)
+        reference = Counter(input.reference_tokens)
+        edits = max(
+            sum((hypothesis - reference).values()),
+            sum((reference - hypothesis).values()),
+        )
+        return 100 - clamp(edits / len(input.reference_tokens), 0, 1) * 100
+
+
+def write_diff(input: MetricInput, output_file_dir: Path) -> None:
+    with input.profile_logger.log_time("xater.diff"):
+        cdiff = "\n".join(
+            unified_diff(
+                input.reference_tokens,
+                input.hypothesis_tokens,
+                fromfile="reference",
+                tofile="hypothesis",
+            )
+        )
+    (output_file_dir / "hypothesis_tokenized.txt").write_text(
+        "\n".join(input.hypothesis_tokens)
+    )
+    (output_file_dir / "referenced_tokenized.txt").write_text(
+        "\n".join(input.reference_tokens)
+    )
+    output_file_path = output_file_dir / "unified_diff.txt"
+    output_file_path.write_text(cdiff)
+
 
 def clamp(number, bottom, top):
     return max(bottom, min(number, top))